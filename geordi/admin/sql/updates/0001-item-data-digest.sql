@@ -0,0 +1,9 @@
+-- Store a digest of each data item's data as it was given, so reimporting
+-- unchanged data can skip it. Whether the rules changed is told by the
+-- mapping rules version items record (see 0002). Existing rows get no
+-- digest, and are stored again the next time they are imported.
+BEGIN;
+
+ALTER TABLE geordi.item_data ADD COLUMN digest VARCHAR;
+
+COMMIT;
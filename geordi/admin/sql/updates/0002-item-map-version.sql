@@ -0,0 +1,8 @@
+-- Record which version of the mapping rules made each item's map, so items
+-- can be remapped when rules change. Existing items get no version, and are
+-- all picked up by the first 'manage.py data remap'.
+BEGIN;
+
+ALTER TABLE geordi.item ADD COLUMN map_version VARCHAR;
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- A manifest of the files importers have finished with, so an interrupted
+-- import can be resumed with --resume without reading those files again.
+-- Modification times are whole nanoseconds, so they read back exactly as
+-- they were written.
+BEGIN;
+
+CREATE TABLE geordi.import_file (
+    path VARCHAR PRIMARY KEY,
+    size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    digest VARCHAR,
+    status VARCHAR NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- Keep the index, item type and identifier parts of each data item's ID in
+-- columns of their own, indexed together, so listing the indexes, the item
+-- types of an index and the items of a type doesn't scan the whole table.
+BEGIN;
+
+ALTER TABLE geordi.item_data ADD COLUMN index VARCHAR;
+ALTER TABLE geordi.item_data ADD COLUMN item_type VARCHAR;
+ALTER TABLE geordi.item_data ADD COLUMN local_id VARCHAR;
+
+UPDATE geordi.item_data
+   SET index = split_part(id, '/', 1),
+       item_type = split_part(id, '/', 2),
+       local_id = substring(id from '^[^/]*/[^/]*/(.*)$');
+
+ALTER TABLE geordi.item_data ALTER COLUMN index SET NOT NULL;
+ALTER TABLE geordi.item_data ALTER COLUMN item_type SET NOT NULL;
+
+CREATE INDEX item_data_idx_index_item_type_local_id ON geordi.item_data (index, item_type, local_id);
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Store items' maps and data items' data as jsonb rather than JSON text, so
+-- they're parsed once on the way in and can be queried in SQL.
+BEGIN;
+
+ALTER TABLE geordi.item ALTER COLUMN map TYPE JSONB USING CAST(map AS jsonb);
+ALTER TABLE geordi.item_data ALTER COLUMN data TYPE JSONB USING CAST(data AS jsonb);
+
+COMMIT;
@@ -7,6 +7,8 @@ from geordi import errors
 from geordi.user import User
 from geordi.data.model import db
 from geordi.data.model.editor import Editor
+from geordi.data.mapping import set_map_validation
+from geordi.data.mapping.trace import LoggingTracer, set_tracer
 import geordi.base_settings
 import jinja2_highlight
 import logging
@@ -44,10 +46,15 @@ def create_app(settings_file='settings.cfg', *args, **kwargs):
         _setup_logger('sqlalchemy.engine', logging.INFO)
     if kwargs.get('log_debug'):
         _setup_logger('geordi', logging.DEBUG)
+    if kwargs.get('trace_mapping'):
+        if not kwargs.get('log_debug'):
+            _setup_logger('geordi.data.mapping.trace', logging.DEBUG)
+        set_tracer(LoggingTracer())
 
     # Config
     app.config.from_object(geordi.base_settings)
     app.config.from_pyfile(settings_file, silent=True)
+    set_map_validation(app.config['MAP_VALIDATION'])
 
     # Extensions
     db.init_app(app)
@@ -1,8 +1,12 @@
-from flask import Blueprint, abort, jsonify
-from geordi.data.model import db
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
 from geordi.data.model.item import Item
 from geordi.data.model.item_data import ItemData
+from geordi.data.model.item_link import ItemLink
 from geordi.data.model.raw_match import RawMatch
+from geordi.listing import list_limit
+
+import itertools
+import json
 
 api = Blueprint('api', __name__)
 
@@ -12,10 +16,38 @@ def item_data(item_id):
 
     :resheader Content-Type: *application/json*
     """
-    item = Item.get(item_id)
-    if item is None:
+    # The database puts the stored JSON together, so it's never parsed here.
+    item_json = Item.get_json(item_id)
+    if item_json is None:
         abort(404)
-    return jsonify(item.to_dict())
+    return Response(item_json, mimetype='application/json')
+
+@api.route('/items', methods=['GET', 'POST'])
+def items_data():
+    """Get several items' data, links, and maps at once, by item ID. Items
+    that were merged into others are given as the items they were merged into,
+    and listed under ``redirects``; IDs of no item are given as null.
+
+    :query ids: the item IDs, separated by commas
+    :reqjson ids: the item IDs as a list, when POSTed instead
+    :resheader Content-Type: *application/json*
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        item_ids = body.get('ids') if isinstance(body, dict) else None
+        if not isinstance(item_ids, list) or not all(type(item_id) in (int, long) for item_id in item_ids):
+            abort(400)
+    else:
+        try:
+            item_ids = [int(item_id) for item_id in request.args.get('ids', '').split(',')]
+        except ValueError:
+            abort(400)
+    item_ids = set(item_ids)
+    if not item_ids or len(item_ids) > current_app.config['MAX_ITEMS_PER_REQUEST'] or \
+            not all(0 < item_id < 2 ** 31 for item_id in item_ids):
+        abort(400)
+    # As with item_data, the database puts the JSON together.
+    return Response(Item.get_json_many(item_ids), mimetype='application/json')
 
 @api.route('/item/<int:item_id>/links')
 def item_links(item_id):
@@ -23,11 +55,10 @@ def item_links(item_id):
 
     :resheader Content-Type: *application/json*
     """
-    item = Item.query.filter_by(id=item_id).options(db.joinedload('items_linked').joinedload('item')).first()
-    if item is None:
+    if Item.get(item_id, load='summary') is None:
         abort(404)
     links = []
-    for item_link in item.items_linked:
+    for item_link in ItemLink.get_by_linked_id(item_id):
         links.append(dict(
             item_id=item_link.item_id,
             path=item_link.type,
@@ -67,14 +98,27 @@ def list_index(index):
 
 @api.route('/data/<index>/<item_type>')
 def list_items(index, item_type):
-    """Get list of items for a specified index and item type.
+    """Get list of items for a specified index and item type, a page at a time.
 
-    :resheader Content-Type: *application/json*
+    :query after: list the items after this one, as given by ``next`` for the previous page
+    :query limit: how many items to list, up to a maximum
+    :query format: ``ndjson`` to stream all the items (after ``after``) instead, one JSON string per line
+    :resheader Content-Type: *application/json* or *application/x-ndjson*
     """
-    item_ids = ItemData.get_item_ids(index, item_type)
-    if not item_ids:
+    after = request.args.get('after')
+    if request.args.get('format') == 'ndjson':
+        item_ids = ItemData.iter_item_ids(index, item_type, after)
+        first = next(item_ids, None)
+        if first is None and after is None:
+            abort(404)
+        lines = (json.dumps(item_id) + '\n' for item_id in itertools.chain([first] if first is not None else [], item_ids))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    limit = list_limit()
+    item_ids = ItemData.get_item_ids(index, item_type, after, limit + 1)
+    if not item_ids and after is None:
         abort(404)
-    return jsonify(index=index, item_type=item_type, items=item_ids)
+    next_after = item_ids[limit - 1] if len(item_ids) > limit else None
+    return jsonify(index=index, item_type=item_type, items=item_ids[:limit], next=next_after)
 
 @api.route('/data/<index>/<item_type>/<path:data_id>')
 def data_item(index, item_type, data_id):
@@ -1,6 +1,9 @@
-from geordi.test_case import GeordiTestCase
+from geordi.test_case import GeordiTestCase, linked_item
 from geordi.data.model.item import Item
 from geordi.data.model.item_data import ItemData
+from geordi.data.model.item_redirect import ItemRedirect
+from geordi.data.model import db
+import json
 
 
 class APIViewsTestCase(GeordiTestCase):
@@ -19,6 +22,36 @@ class APIViewsTestCase(GeordiTestCase):
         response = self.client.get("/api/1/item/missing")
         self.assert404(response)
 
+    def test_items(self):
+        item = linked_item()
+        db.session.add(ItemRedirect(old_id=item.id + 100, new_id=item.id))
+        db.session.commit()
+        item_ids = [item.id, item.id + 1, item.id + 100, item.id + 101]
+        expected = {'items': {str(item.id): Item.get(item.id).to_dict(),
+                              str(item.id + 1): Item.get(item.id + 1).to_dict(),
+                              str(item.id + 100): Item.get(item.id).to_dict(),
+                              str(item.id + 101): None},
+                    'redirects': {str(item.id + 100): item.id}}
+
+        url = "/api/1/items?ids=%s" % ','.join(str(item_id) for item_id in item_ids)
+        with self.recorded_statements() as statements:
+            response = self.client.get(url)
+        self.assert200(response)
+        self.assertEquals(response.json, expected)
+        self.assertEqual(len(statements), 1)
+
+        response = self.client.post("/api/1/items", data=json.dumps({'ids': item_ids}), content_type='application/json')
+        self.assert200(response)
+        self.assertEquals(response.json, expected)
+
+        self.assert400(self.client.get("/api/1/items"))
+        self.assert400(self.client.get("/api/1/items?ids=1,x"))
+        self.assert400(self.client.get("/api/1/items?ids=%d" % 2 ** 31))
+        self.assert400(self.client.post("/api/1/items", data=json.dumps({'ids': ['1']}), content_type='application/json'))
+        self.assert400(self.client.post("/api/1/items", data='[1]', content_type='application/json'))
+        self.app.config['MAX_ITEMS_PER_REQUEST'] = 3
+        self.assert400(self.client.get(url))
+
     def test_item_links(self):
         item = Item.create()
 
@@ -32,6 +65,24 @@ class APIViewsTestCase(GeordiTestCase):
         response = self.client.get("/api/1/item/missing/links")
         self.assert404(response)
 
+    def test_item_statements(self):
+        item = linked_item()
+        url = "/api/1/item/%s" % item.id
+        with self.recorded_statements() as statements:
+            response = self.client.get(url)
+        self.assertEquals(response.json, Item.get(item.id).to_dict())
+        self.assertEqual(len(statements), 1)
+
+    def test_item_links_statements(self):
+        item = linked_item()
+        url = "/api/1/item/%s/links" % item.id
+        with self.recorded_statements() as statements:
+            response = self.client.get(url)
+        self.assertEqual(len(response.json['links']), 3)
+        # One each for the item, its links, and the maps they're from; no raw data.
+        self.assertEqual(len(statements), 3)
+        self.assertFalse([statement for statement in statements if 'item_data' in statement])
+
     def test_item_matches(self):
         item = Item.create()
 
@@ -71,11 +122,43 @@ class APIViewsTestCase(GeordiTestCase):
         response = self.client.get("/api/1/data/%s/%s" % (index, item_type))
         self.assert200(response)
         self.assertEquals(response.json, dict(index=index, item_type=item_type,
-                                              items=ItemData.get_item_ids(index, item_type)))
+                                              items=ItemData.get_item_ids(index, item_type), next=None))
 
         response = self.client.get("/api/1/data/%s/missing" % index)
         self.assert404(response)
 
+    def test_list_items_pages(self):
+        item = Item.create()
+        for data_id in ['c', 'a', 'b/1']:
+            ItemData.create(item_id=item.id, data_json='{}', data_id='test/album/' + data_id)
+
+        response = self.client.get("/api/1/data/test/album?limit=2")
+        self.assert200(response)
+        self.assertEquals(response.json, dict(index='test', item_type='album', items=['a', 'b/1'], next='b/1'))
+
+        response = self.client.get("/api/1/data/test/album?limit=2&after=b/1")
+        self.assertEquals(response.json, dict(index='test', item_type='album', items=['c'], next=None))
+
+        response = self.client.get("/api/1/data/test/album?after=c")
+        self.assert200(response)
+        self.assertEquals(response.json['items'], [])
+
+    def test_list_items_ndjson(self):
+        item = Item.create()
+        for data_id in ['c', 'a', 'b/1']:
+            ItemData.create(item_id=item.id, data_json='{}', data_id='test/album/' + data_id)
+
+        response = self.client.get("/api/1/data/test/album?format=ndjson")
+        self.assert200(response)
+        self.assertEquals(response.mimetype, 'application/x-ndjson')
+        self.assertEquals(response.data, '"a"\n"b/1"\n"c"\n')
+
+        response = self.client.get("/api/1/data/test/album?format=ndjson&after=a")
+        self.assertEquals(response.data, '"b/1"\n"c"\n')
+
+        response = self.client.get("/api/1/data/test/missing?format=ndjson")
+        self.assert404(response)
+
     def test_data_item(self):
         item = Item.create()
         index = 'test'
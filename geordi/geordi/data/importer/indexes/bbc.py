@@ -1,7 +1,11 @@
+import io
 import os
+import re
 import sys
 import json
 
+_NON_WHITESPACE = re.compile(r'\S')
+
 
 def entity2json(entity):
     return json.dumps(entity, separators=(',', ':'), sort_keys=True)
@@ -9,40 +13,84 @@ def entity2json(entity):
 def is_list(value):
     return isinstance(value, (list, tuple))
 
-def bbc_setup(add_folder, add_data_item, import_manager):
-    def add_artist(artist):
-        print add_data_item('bbc/artist/' + str(artist['id']), 'artist', entity2json(artist))
-
-    def add_work(work):
-        print add_data_item('bbc/work/' + str(work['id']), 'work', entity2json(work))
+def iter_json_array(json_file, block_size=1 << 16):
+    '''
+    Yield the elements of a JSON array one at a time from a file opened for
+    reading text, reading it a block at a time rather than all at once.
+    Raises ValueError if the file doesn't hold an array, or on bad JSON once
+    the elements before it have been yielded.
+    '''
+    decoder = json.JSONDecoder()
+    (buf, pos, eof) = (u'', 0, False)
+    expect = '['
+    while True:
+        match = _NON_WHITESPACE.search(buf, pos)
+        if match is not None:
+            pos = match.start()
+            char = buf[pos]
+            if expect == '[':
+                if char != '[':
+                    raise ValueError('JSON data is not a list at top level.')
+                (pos, expect) = (pos + 1, 'first')
+                continue
+            elif expect == ',':
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ValueError('Expecting , delimiter: char %d' % pos)
+                (pos, expect) = (pos + 1, 'element')
+                continue
+            elif char == ']' and expect == 'first':
+                return
+            try:
+                (element, end) = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                # A number at the end of the buffer may carry on in the next block.
+                if end < len(buf) or eof:
+                    yield element
+                    (pos, expect) = (end, ',')
+                    continue
+        elif eof:
+            raise ValueError('Unexpected end of JSON data.')
+        block = json_file.read(block_size)
+        eof = not block
+        (buf, pos) = (buf[pos:] + block, 0)
 
-    def _import_bbc_json(json_file):
-        if not json_file.endswith('.json'):
-            print 'Skipping non-JSON file ' + json_file
-            return
+def artist_data_item(artist):
+    return ('bbc/artist/' + str(artist['id']), 'artist', entity2json(artist))
 
-        try:
-            json_data = json.load(open(json_file, 'r'))
-        except Exception as e:
-            print 'Skipping %s: %s: %s' % (json_file, type(e).__name__, e)
-            return
+def work_data_item(work):
+    return ('bbc/work/' + str(work['id']), 'work', entity2json(work))
 
-        if is_list(json_data):
-            print 'Processing ' + json_file
+def bbc_data_items(json_file):
+    if not json_file.endswith('.json'):
+        print 'Skipping non-JSON file ' + json_file
+        return
 
-            for work in json_data:
-                if 'composer' in work:
-                    add_artist(work['composer'])
-                add_work(work)
-        else:
-            print 'Skipping %s: JSON data is not a list at top level.' % json_file
+    print 'Processing ' + json_file
+    # Composers are given with every work they composed, so add each once.
+    composers = set()
+    with io.open(json_file, 'r', encoding='utf-8') as f:
+        for work in iter_json_array(f):
+            composer = work.get('composer')
+            if composer is not None and composer['id'] not in composers:
+                composers.add(composer['id'])
+                yield artist_data_item(composer)
+            yield work_data_item(work)
 
+def bbc_setup(add_folder, add_data_items, add_files, import_manager):
     @import_manager.command
-    def bbc(path):
+    def bbc(path, chunk_size=500, jobs=1, resume=False, verify=False):
         """Import JSON from BBC Proms data."""
+        add_files(bbc_data_items, _bbc_files(path), int(chunk_size), int(jobs), resume, verify)
+
+    def _bbc_files(path):
         if os.path.isdir(path):
             for root, dirs, files in os.walk(path):
                 for file_name in files:
-                    _import_bbc_json(os.path.join(root, file_name))
+                    yield os.path.join(root, file_name)
         else:
-            _import_bbc_json(path)
+            yield path
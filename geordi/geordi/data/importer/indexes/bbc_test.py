@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from geordi.data.importer.indexes.bbc import bbc_data_items, iter_json_array
+import io
+import json
+import os
+import shutil
+import tempfile
+
+WORKS = [
+    {'id': 1, 'title': u'Symphony No. 9 “From the New World”', 'duration': 2520,
+     'composer': {'id': 10, 'name': u'Anton\xedn Dvoř\xe1k'}},
+    {'id': 2, 'title': 'Cello Concerto', 'duration': 2400.5, 'tags': [[], {}, None, True, -1e3],
+     'composer': {'id': 10, 'name': u'Anton\xedn Dvoř\xe1k'}},
+    {'id': 3, 'title': 'Jerusalem', 'composer': {'id': 11, 'name': 'Hubert Parry'}},
+    {'id': 4, 'title': 'Traditional'},
+]
+
+
+class BBCJSONTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json_file = os.path.join(self.directory, 'works.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _elements(self, text, block_size):
+        return list(iter_json_array(io.StringIO(text), block_size))
+
+    def test_iter_json_array(self):
+        text = json.dumps(WORKS, indent=2, ensure_ascii=False)
+        for block_size in [1, 2, 7, 64, 1 << 16]:
+            self.assertEqual(self._elements(text, block_size), WORKS)
+        self.assertEqual(self._elements(u' [ 12 , 345,6 ] ', 1), [12, 345, 6])
+        self.assertEqual(self._elements(u'[]', 1), [])
+        self.assertEqual(self._elements(u' [\n] ', 1), [])
+
+    def test_iter_json_array_bad(self):
+        self.assertRaises(ValueError, self._elements, u'{"id": 1}', 4)
+        self.assertRaises(ValueError, self._elements, u'', 4)
+        elements = iter_json_array(io.StringIO(u'[{"id": 1}, {"id": 2}, {"id"'), 4)
+        self.assertEqual([next(elements), next(elements)], [{'id': 1}, {'id': 2}])
+        self.assertRaises(ValueError, next, elements)
+        elements = iter_json_array(io.StringIO(u'[1 2]'), 4)
+        self.assertEqual(next(elements), 1)
+        self.assertRaises(ValueError, next, elements)
+
+    def test_bbc_data_items(self):
+        with open(self.json_file, 'w') as f:
+            json.dump(WORKS, f)
+        data_items = list(bbc_data_items(self.json_file))
+        self.assertEqual([(data_id, data_type) for (data_id, data_type, data) in data_items],
+                         [('bbc/artist/10', 'artist'), ('bbc/work/1', 'work'), ('bbc/work/2', 'work'),
+                          ('bbc/artist/11', 'artist'), ('bbc/work/3', 'work'), ('bbc/work/4', 'work')])
+        self.assertEqual([json.loads(data) for (data_id, data_type, data) in data_items if data_type == 'work'], WORKS)
+
+    def test_bbc_data_items_truncated(self):
+        with open(self.json_file, 'w') as f:
+            text = json.dumps(WORKS)
+            f.write(text[:text.index('Traditional')])
+        # What was read before the error is given first, and the error is left to add_files.
+        data_items = bbc_data_items(self.json_file)
+        self.assertEqual([next(data_items)[0] for i in range(5)],
+                         ['bbc/artist/10', 'bbc/work/1', 'bbc/work/2', 'bbc/artist/11', 'bbc/work/3'])
+        self.assertRaises(ValueError, next, data_items)
+        with open(self.json_file, 'w') as f:
+            json.dump({'works': WORKS}, f)
+        self.assertRaises(ValueError, list, bbc_data_items(self.json_file))
@@ -1,5 +1,11 @@
 import xlrd
+import datetime
 import json
+from collections import OrderedDict
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
 # First are the "old" spreadsheet, then all the new-style ones.
 # No sense bothering to remove the couple of duplicates, I figure.
 invariants = ([u'SUB_LABEL', u'MAIN LABEL', u'PRODUCT TITLE', u'PRODUCT VERSION',
@@ -52,46 +58,90 @@ def track_sort(track):
                 return track[key_field]
     return None
 
-def ninjatune_setup(add_folder, add_data_item, import_manager):
+def xls_rows(xls_file):
+    '''Yield the rows of the first sheet of a spreadsheet as lists of cell
+       values, with dates as tuples. .xlsx files are streamed with openpyxl
+       where it's installed; anything else is read with xlrd, loading only the
+       first sheet.'''
+    if xls_file.endswith('.xlsx') and openpyxl is not None:
+        return _xlsx_rows(xls_file)
+    return _xls_rows(xls_file)
+
+def _xls_rows(xls_file):
+    book = xlrd.open_workbook(xls_file, on_demand=True)
+    try:
+        for row in book.sheet_by_index(0).get_rows():
+            # Fix dates to tuple/array format. ctype 3 is XL_CELL_DATE
+            yield [xlrd.xldate_as_tuple(cell.value, book.datemode) if cell.ctype == 3 else cell.value for cell in row]
+    finally:
+        book.release_resources()
+
+def _xlsx_rows(xlsx_file):
+    book = openpyxl.load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        for row in book.worksheets[0].iter_rows(values_only=True):
+            yield [_xlsx_value(value) for value in row]
+    finally:
+        book.close()
+
+def _xlsx_value(value):
+    '''Convert an openpyxl cell value to what xlrd gives for the same cell.'''
+    if value is None:
+        return u''
+    elif isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, (int, long)):
+        return float(value)
+    elif isinstance(value, datetime.datetime):
+        return value.timetuple()[:6]
+    elif isinstance(value, datetime.date):
+        return value.timetuple()[:3] + (0, 0, 0)
+    elif isinstance(value, datetime.time):
+        return (0, 0, 0, value.hour, value.minute, value.second)
+    return value
+
+def ninjatune_data_items(xls_file):
+    '''Yield a data item for each release in a ninjatune spreadsheet, with
+       its tracks gathered from the rows sharing its catalogue number.'''
+    rows = xls_rows(xls_file)
+    headers = next(rows)
+    for i in range(0, len(headers)):
+        if headers[i] == '':
+            headers[i] = 'column:' + str(i)
+        elif headers[i] not in known_fields:
+            raise Exception('Unknown header column %s' % headers[i])
+    columns = dict((header, i) for (i, header) in reversed(list(enumerate(headers))))
+    key_index = None
+    for key_field in [u'CATALOGUE NUMBER', u'Catalogue Number']:
+        if key_field in columns:
+            key_index = columns[key_field]
+            break
+    if key_index is None:
+        raise Exception('Couldn\'t figure out what to use as a key for this file.')
+    is_invariant = [header in invariants for header in headers]
+    padding = [u''] * len(headers)
+    data = OrderedDict()
+    for row in rows:
+        key = row[key_index]
+        if key == '':
+            continue # empty catalogue number field
+        release = data.setdefault(key, {'tracks': []})
+        this_track = {}
+        for (cell_key, invariant, cell_value) in zip(headers, is_invariant, row + padding):
+            if invariant:
+                values = release.setdefault(cell_key, [])
+                if cell_value not in values:
+                    values.append(cell_value)
+            else:
+                this_track[cell_key] = cell_value
+        release['tracks'].append(this_track)
+    for (key, release) in data.iteritems():
+        # Sorting is stable, so tracks with the same number stay in row order.
+        release['tracks'].sort(key=track_sort)
+        yield ('ninjatune/release/' + key, 'release', json.dumps(release, separators=(',', ':'), sort_keys=True))
+
+def ninjatune_setup(add_folder, add_data_items, add_files, import_manager):
     @import_manager.command
-    def ninjatune(xls_file):
-        '''Import ninjatune data provided in a .xls file.'''
-        book = xlrd.open_workbook(xls_file)
-        sh = book.sheet_by_index(0)
-        headers = [cell.value for cell in sh.row(0)]
-        for i in range(0, len(headers)):
-            if headers[i] == '':
-                headers[i] = 'column:' + str(i)
-            elif headers[i] not in known_fields:
-                raise Exception('Unknown header column %s' % headers[i])
-        data = {}
-        for row_number in range(1,sh.nrows):
-            row = sh.row(row_number)
-            key = None
-            for key_field in [u'CATALOGUE NUMBER', u'Catalogue Number']:
-                if key_field in headers:
-                    key = row[headers.index(key_field)].value
-                    break;
-            if key is None:
-                raise Exception('Couldn\'t figure out what to use as a key for this file.')
-            if key == '':
-                continue # empty catalogue number field
-            data[key] = data.get(key, {})
-            this_track = {}
-            for cell_number in range(0, len(row)):
-                cell_key = headers[cell_number]
-                # Fix dates to tuple/array format. ctype 3 is XL_CELL_DATE
-                if row[cell_number].ctype == 3:
-                    cell_value = xlrd.xldate_as_tuple(row[cell_number].value, book.datemode)
-                else:
-                    cell_value = row[cell_number].value
-                if cell_key in invariants:
-                    data[key][cell_key] = data[key].get(cell_key, [])
-                    if cell_value not in data[key][cell_key]:
-                        data[key][cell_key].append(cell_value)
-                else:
-                    this_track[cell_key] = cell_value
-            data[key]['tracks'] = sorted(data[key].get('tracks', []) + [this_track], key=track_sort)
-        for (key, item_data) in data.iteritems():
-            data_id = 'ninjatune/release/' + key
-            print add_data_item(data_id, 'release', json.dumps(item_data, separators=(',', ':'), sort_keys=True))
+    def ninjatune(xls_file, chunk_size=500):
+        '''Import ninjatune data provided in a .xls or .xlsx file.'''
+        add_data_items(ninjatune_data_items(xls_file), int(chunk_size))
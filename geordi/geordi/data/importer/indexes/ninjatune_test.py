@@ -0,0 +1,59 @@
+from unittest import TestCase
+from geordi.data.importer.indexes.ninjatune import _xls_rows, ninjatune_data_items, xls_rows
+import datetime
+import json
+import openpyxl
+import os
+import shutil
+import tempfile
+import xlrd
+
+ROWS = [
+    [u'CATALOGUE NUMBER', u'PRODUCT TITLE', u'MAIN RELEASE DATE', u'TRACK NUMBER', u'MAIN TITLE', None],
+    [u'ZEN1', u'First', datetime.datetime(2003, 2, 1), 2, u'Two', u'x'],
+    [u'ZEN2', u'Second', datetime.datetime(2004, 5, 6), 1, u'Only', None],
+    [u'ZEN1', u'First', datetime.datetime(2003, 2, 1), 1, u'One', None],
+    [None, u'No catalogue number', None, 1, u'Skipped', None],
+    [u'ZEN1', u'First (reissue)', datetime.datetime(2003, 2, 1), 3, u'Three', None],
+]
+
+
+class NinjatuneTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.xlsx_file = os.path.join(self.directory, 'ninjatune.xlsx')
+        book = openpyxl.Workbook()
+        for row in ROWS:
+            book.active.append(row)
+        book.save(self.xlsx_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ninjatune_data_items(self):
+        data_items = list(ninjatune_data_items(self.xlsx_file))
+        self.assertEqual([(data_id, data_type) for (data_id, data_type, data) in data_items],
+                         [('ninjatune/release/ZEN1', 'release'), ('ninjatune/release/ZEN2', 'release')])
+        release = json.loads(data_items[0][2])
+        self.assertEqual(release[u'CATALOGUE NUMBER'], [u'ZEN1'])
+        self.assertEqual(release[u'PRODUCT TITLE'], [u'First', u'First (reissue)'])
+        self.assertEqual(release[u'MAIN RELEASE DATE'], [[2003, 2, 1, 0, 0, 0]])
+        self.assertEqual(release[u'tracks'],
+                         [{u'TRACK NUMBER': 1.0, u'MAIN TITLE': u'One', u'column:5': u''},
+                          {u'TRACK NUMBER': 2.0, u'MAIN TITLE': u'Two', u'column:5': u'x'},
+                          {u'TRACK NUMBER': 3.0, u'MAIN TITLE': u'Three', u'column:5': u''}])
+
+    def test_xls_rows(self):
+        # Streaming an .xlsx file gives the same cell values xlrd does.
+        try:
+            expected = list(_xls_rows(self.xlsx_file))
+        except xlrd.XLRDError:
+            self.skipTest('This version of xlrd cannot read .xlsx files.')
+        self.assertEqual(list(xls_rows(self.xlsx_file)), expected)
+
+    def test_unknown_header(self):
+        book = openpyxl.Workbook()
+        book.active.append([u'CATALOGUE NUMBER', u'SOMETHING ELSE'])
+        book.save(self.xlsx_file)
+        self.assertRaises(Exception, list, ninjatune_data_items(self.xlsx_file))
@@ -1,22 +1,96 @@
+from __future__ import absolute_import
 import os
 import sys
 import re
-import xmltodict
 import json
-
-xmltodict.OrderedDict = dict
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 
 CI_PARTY_ID_NAMESPACE = "DPID:PADPIDA20090302015"
-
-
-def process_xml(content):
-    try:
-        return xmltodict.parse(content,
-                               force_cdata=True,
-                               attr_prefix='_',
-                               cdata_key='text')
-    except:
-        return None
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+# Paths, by tag name as written in the files, of the elements imported from
+# consolidated independent NewReleaseMessages.
+CI_SOUND_RECORDING_PATH = ('ern:NewReleaseMessage', 'ResourceList', 'SoundRecording')
+CI_RELEASE_PATH = ('ern:NewReleaseMessage', 'ReleaseList', 'Release')
+
+
+def iterparse_xml(source, item_paths):
+    '''
+    Stream the elements found at any of item_paths from an XML file, yielding
+    (path, item) tuples. Each item is converted as xmltodict.parse does with
+    force_cdata=True, attr_prefix='_' and cdata_key='text', and every element
+    is freed once complete unless it's part of an item, so memory use doesn't
+    grow with the file.
+    '''
+    item_paths = set(item_paths)
+    # The xml prefix is bound without ever being declared.
+    prefixes = {XML_NAMESPACE: 'xml'}
+    declarations = []
+    path = []
+    elements = []
+    # How many of the elements open are items, still being collected.
+    open_items = 0
+    for (event, value) in ElementTree.iterparse(source, events=('start-ns', 'start', 'end')):
+        if event == 'start-ns':
+            (prefix, uri) = value
+            prefixes[uri] = prefix
+            declarations.append(value)
+        elif event == 'start':
+            # Namespace declarations show up as attributes with xmltodict.
+            for (prefix, uri) in declarations:
+                value.set('xmlns:' + prefix if prefix else 'xmlns', uri)
+            declarations = []
+            path.append(_xml_name(value.tag, prefixes))
+            elements.append(value)
+            if tuple(path) in item_paths:
+                open_items += 1
+        else:
+            this_path = tuple(path)
+            path.pop()
+            elements.pop()
+            if this_path in item_paths:
+                open_items -= 1
+                yield (this_path, _xml_element_to_dict(value, prefixes))
+            if elements and not open_items:
+                elements[-1].remove(value)
+
+
+def _xml_name(name, prefixes):
+    '''Turn an ElementTree {uri}name back into prefix:name, as written.'''
+    if name[0] == '{':
+        (uri, name) = name[1:].split('}', 1)
+        prefix = prefixes.get(uri)
+        if prefix:
+            return prefix + ':' + name
+    return name
+
+
+def _xml_element_to_dict(element, prefixes):
+    item = None
+    if element.attrib:
+        item = dict(('_' + _xml_name(key, prefixes), value) for (key, value) in element.attrib.iteritems())
+    data = [element.text or '']
+    for child in element:
+        if item is None:
+            item = {}
+        name = _xml_name(child.tag, prefixes)
+        value = _xml_element_to_dict(child, prefixes)
+        if name not in item:
+            item[name] = value
+        elif is_list(item[name]):
+            item[name].append(value)
+        else:
+            item[name] = [item[name], value]
+        data.append(child.tail or '')
+    data = ''.join(data).strip() or None
+    if data is not None:
+        if item is None:
+            item = {}
+        item['text'] = data
+    return item
 
 
 def entity2json(entity):
@@ -34,99 +108,106 @@ def force_list(node, child_name):
     return value
 
 
-def xml_setup(add_folder, add_data_item, import_manager):
-    def _import_ci_xml(xml_file):
-        if not xml_file.endswith('.xml'):
-            print 'Skipping non-XML file ' + xml_file
-            return
-
-        try:
-            root = process_xml(open(xml_file, 'r').read())['ern:NewReleaseMessage']
-        except Exception as e:
-            print 'Skipping %s: %s: %s' % (xml_file, type(e).__name__, e)
-            return
-
-        print 'Processing ' + xml_file
-
-        def get_pid(data):
-            pid = data['ProprietaryId']
-
-            if is_list(pid):
-                raise Exception('Multiple ProprietaryId nodes')
-
-            # I don't see any ProprietaryIds in the dumps that use a namespace
-            # other than CI's, but it would probably be bad if there ever were
-            # any, so this seems reasonable.
-            if pid['_Namespace'] != CI_PARTY_ID_NAMESPACE:
-                raise Exception('Missing ProprietaryId')
-
-            return pid['text']
-
-        # A Release is linked to SoundRecordings via their ResourceReferences.
-        # In most cases, it appears that the ResourceReference is just the
-        # ProprietaryId with the letter 'A' prefixing it, but there are
-        # instances where it's not. Also, according to DDEX docs,
-        # ResourceReferences are only valid for a specific DdexMessage,
-        # meaning we probably shouldn't rely on them for indexing purposes.
-        recordings_by_reference = {}
-
-        sound_recordings = root['ResourceList']['SoundRecording']
-        if not is_list(sound_recordings):
-            sound_recordings = [sound_recordings]
-
-        for recording in sound_recordings:
-            recordings_by_reference[recording['ResourceReference']['text']] = recording
-
-            # All the dumps seem to have only one Worldwide territory for all
-            # Recordings, so the code assumes that to be a constant and would
-            # probably break otherwise.
-            details = recording['SoundRecordingDetailsByTerritory']
-            if is_list(details):
-                raise Exception('Multiple SoundRecordingDetailsByTerritory nodes')
-
-            force_list(details, 'Genre')
-            force_list(details, 'ResourceContributor')
-            force_list(details, 'IndirectResourceContributor')
-
-            print add_data_item('ci/recording/' + get_pid(recording['SoundRecordingId']), 'recording', entity2json(recording))
-
-        for release in root['ReleaseList']['Release']:
-            # Releases of type "TrackRelease" contain a single recording.
-            # I'm assuming these are mostly analogous to standalone
-            # recordings, because there's a separate "Single" ReleaseType
-            # that's also used.
-            #
-            # So even though we're skipping it here (so that it's not indexed
-            # as a release), the recording info for it will have already been
-            # indexed above.
-            if release['ReleaseType']['text'] == 'TrackRelease':
-                continue
-
-            # Handle releases that have only one track.
-            resource_references = force_list(release['ReleaseResourceReferenceList'], 'ReleaseResourceReference')
-
-            # Needed by the mapping step to link tracks with recordings.
-            for ref in resource_references:
-                recording = recordings_by_reference[ref['text']]
-                ref['_ProprietaryId'] = get_pid(recording['SoundRecordingId'])
-                ref['_RecordingName'] = recording['ReferenceTitle']['TitleText']['text']
-                ref['_RecordingDuration'] = recording['Duration']['text']
-
-            # See comment for SoundRecordingDetailsByTerritory above.
-            details = release['ReleaseDetailsByTerritory']
-            if is_list(details):
-                raise Exception('Multiple ReleaseDetailsByTerritory nodes')
-
-            force_list(details, 'Genre')
-
-            print add_data_item('ci/release/' + get_pid(release['ReleaseId']), 'release', entity2json(release))
+def get_pid(data):
+    pid = data['ProprietaryId']
+
+    if is_list(pid):
+        raise Exception('Multiple ProprietaryId nodes')
+
+    # I don't see any ProprietaryIds in the dumps that use a namespace
+    # other than CI's, but it would probably be bad if there ever were
+    # any, so this seems reasonable.
+    if pid['_Namespace'] != CI_PARTY_ID_NAMESPACE:
+        raise Exception('Missing ProprietaryId')
+
+    return pid['text']
+
+
+def ci_data_items(xml_file):
+    '''Yield (data ID, type, data) tuples for the recordings and releases in a CI XML file.'''
+    if not xml_file.endswith('.xml'):
+        print 'Skipping non-XML file ' + xml_file
+        return
+
+    print 'Processing ' + xml_file
 
+    # A Release is linked to SoundRecordings via their ResourceReferences.
+    # In most cases, it appears that the ResourceReference is just the
+    # ProprietaryId with the letter 'A' prefixing it, but there are
+    # instances where it's not. Also, according to DDEX docs,
+    # ResourceReferences are only valid for a specific DdexMessage,
+    # meaning we probably shouldn't rely on them for indexing purposes.
+    # Only the ProprietaryId, name and duration releases need are kept.
+    recordings_by_reference = {}
+
+    for (path, item) in iterparse_xml(xml_file, [CI_SOUND_RECORDING_PATH, CI_RELEASE_PATH]):
+        if path == CI_SOUND_RECORDING_PATH:
+            data_item = _recording_data_item(item)
+            recordings_by_reference[item['ResourceReference']['text']] = (
+                get_pid(item['SoundRecordingId']),
+                item['ReferenceTitle']['TitleText']['text'],
+                item['Duration']['text'])
+            yield data_item
+        else:
+            data_item = _release_data_item(item, recordings_by_reference)
+            if data_item is not None:
+                yield data_item
+
+
+def _recording_data_item(recording):
+    # All the dumps seem to have only one Worldwide territory for all
+    # Recordings, so the code assumes that to be a constant and would
+    # probably break otherwise.
+    details = recording['SoundRecordingDetailsByTerritory']
+    if is_list(details):
+        raise Exception('Multiple SoundRecordingDetailsByTerritory nodes')
+
+    force_list(details, 'Genre')
+    force_list(details, 'ResourceContributor')
+    force_list(details, 'IndirectResourceContributor')
+
+    return ('ci/recording/' + get_pid(recording['SoundRecordingId']), 'recording', entity2json(recording))
+
+
+def _release_data_item(release, recordings_by_reference):
+    # Releases of type "TrackRelease" contain a single recording.
+    # I'm assuming these are mostly analogous to standalone
+    # recordings, because there's a separate "Single" ReleaseType
+    # that's also used.
+    #
+    # So even though we're skipping it here (so that it's not indexed
+    # as a release), the recording info for it will have already been
+    # indexed above.
+    if release['ReleaseType']['text'] == 'TrackRelease':
+        return None
+
+    # Handle releases that have only one track.
+    resource_references = force_list(release['ReleaseResourceReferenceList'], 'ReleaseResourceReference')
+
+    # Needed by the mapping step to link tracks with recordings.
+    for ref in resource_references:
+        (ref['_ProprietaryId'], ref['_RecordingName'], ref['_RecordingDuration']) = recordings_by_reference[ref['text']]
+
+    # See comment for SoundRecordingDetailsByTerritory above.
+    details = release['ReleaseDetailsByTerritory']
+    if is_list(details):
+        raise Exception('Multiple ReleaseDetailsByTerritory nodes')
+
+    force_list(details, 'Genre')
+
+    return ('ci/release/' + get_pid(release['ReleaseId']), 'release', entity2json(release))
+
+
+def xml_setup(add_folder, add_data_items, add_files, import_manager):
     @import_manager.command
-    def ci(path):
+    def ci(path, chunk_size=500, jobs=1, resume=False, verify=False):
         """Import DDEX data from consolidated independent XML dumps."""
+        add_files(ci_data_items, _ci_files(path), int(chunk_size), int(jobs), resume, verify)
+
+    def _ci_files(path):
         if os.path.isdir(path):
             for root, dirs, files in os.walk(path):
                 for file_name in files:
-                    _import_ci_xml(os.path.join(root, file_name))
+                    yield os.path.join(root, file_name)
         else:
-            _import_ci_xml(path)
+            yield path
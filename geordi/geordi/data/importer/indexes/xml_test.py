@@ -0,0 +1,149 @@
+from unittest import TestCase
+from geordi.data.importer.indexes import xml
+from geordi.data.importer.indexes.xml import CI_RELEASE_PATH, CI_SOUND_RECORDING_PATH, ci_data_items, iterparse_xml
+import json
+import os
+import shutil
+import tempfile
+import xmltodict
+
+MESSAGE = '''<?xml version="1.0" encoding="UTF-8"?>
+<ern:NewReleaseMessage xmlns:ern="http://ddex.net/xml/ern/341" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+                       MessageSchemaVersionId="ern/341" xsi:schemaLocation="http://ddex.net/xml/ern/341 ern.xsd">
+  <MessageHeader>
+    <MessageId>1</MessageId>
+  </MessageHeader>
+  <ResourceList>
+    <SoundRecording>
+      <SoundRecordingType>MusicalWorkSoundRecording</SoundRecordingType>
+      <SoundRecordingId>
+        <ISRC>GBAAA0000001</ISRC>
+        <ProprietaryId Namespace="DPID:PADPIDA20090302015">1000001</ProprietaryId>
+      </SoundRecordingId>
+      <ResourceReference>A1</ResourceReference>
+      <ReferenceTitle><TitleText>Holding On</TitleText><SubTitle/></ReferenceTitle>
+      <Duration>PT3M25S</Duration>
+      <SoundRecordingDetailsByTerritory>
+        <TerritoryCode>Worldwide</TerritoryCode>
+        <Title TitleType="DisplayTitle" xml:lang="en"><TitleText>Holding On</TitleText></Title>
+        <DisplayArtist><PartyName><FullName>Mari &amp; the Peaches</FullName></PartyName></DisplayArtist>
+        <Genre><GenreText>Electronic</GenreText></Genre>
+      </SoundRecordingDetailsByTerritory>
+    </SoundRecording>
+    <SoundRecording>
+      <SoundRecordingId>
+        <ProprietaryId Namespace="DPID:PADPIDA20090302015">1000002</ProprietaryId>
+      </SoundRecordingId>
+      <ResourceReference>A2</ResourceReference>
+      <ReferenceTitle><TitleText>Caged</TitleText></ReferenceTitle>
+      <Duration>PT1H2M3S</Duration>
+      <SoundRecordingDetailsByTerritory>
+        <TerritoryCode>Worldwide</TerritoryCode>
+        <ResourceContributor><PartyName><FullName>Mari</FullName></PartyName><ResourceContributorRole>Producer</ResourceContributorRole></ResourceContributor>
+        <Comment>  mixed <b>content</b> text  </Comment>
+      </SoundRecordingDetailsByTerritory>
+    </SoundRecording>
+  </ResourceList>
+  <ReleaseList>
+    <Release>
+      <ReleaseId><ProprietaryId Namespace="DPID:PADPIDA20090302015">2000001</ProprietaryId></ReleaseId>
+      <ReleaseReference>R0</ReleaseReference>
+      <ReleaseType>Album</ReleaseType>
+      <ReleaseResourceReferenceList>
+        <ReleaseResourceReference ReleaseResourceType="PrimaryResource">A1</ReleaseResourceReference>
+        <ReleaseResourceReference>A2</ReleaseResourceReference>
+      </ReleaseResourceReferenceList>
+      <ReleaseDetailsByTerritory>
+        <TerritoryCode>Worldwide</TerritoryCode>
+        <Genre><GenreText>Electronic</GenreText></Genre>
+      </ReleaseDetailsByTerritory>
+    </Release>
+    <Release>
+      <ReleaseId><ProprietaryId Namespace="DPID:PADPIDA20090302015">2000002</ProprietaryId></ReleaseId>
+      <ReleaseType>TrackRelease</ReleaseType>
+      <ReleaseResourceReferenceList><ReleaseResourceReference>A1</ReleaseResourceReference></ReleaseResourceReferenceList>
+    </Release>
+  </ReleaseList>
+</ern:NewReleaseMessage>
+'''
+
+
+def _normalize(data):
+    return json.loads(json.dumps(data, sort_keys=True))
+
+
+class CIXMLTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.xml_file = os.path.join(self.directory, 'message.xml')
+        with open(self.xml_file, 'w') as f:
+            f.write(MESSAGE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_iterparse_xml(self):
+        root = xmltodict.parse(MESSAGE, force_cdata=True, attr_prefix='_', cdata_key='text')['ern:NewReleaseMessage']
+        expected = ([(CI_SOUND_RECORDING_PATH, item) for item in root['ResourceList']['SoundRecording']] +
+                    [(CI_RELEASE_PATH, item) for item in root['ReleaseList']['Release']])
+        items = list(iterparse_xml(self.xml_file, [CI_SOUND_RECORDING_PATH, CI_RELEASE_PATH]))
+        self.assertEqual(_normalize(items), _normalize(expected))
+
+    def test_iterparse_xml_root(self):
+        # Namespace declarations are kept as attributes, as xmltodict does.
+        expected = xmltodict.parse(MESSAGE, force_cdata=True, attr_prefix='_', cdata_key='text')['ern:NewReleaseMessage']
+        ((path, root),) = list(iterparse_xml(self.xml_file, [('ern:NewReleaseMessage',)]))
+        self.assertEqual(_normalize(root), _normalize(expected))
+
+    def test_iterparse_xml_frees_elements(self):
+        deals = ''.join('<ReleaseDeal><Deal><TerritoryCode>%d</TerritoryCode></Deal></ReleaseDeal>' % n for n in range(2000))
+        with open(self.xml_file, 'w') as f:
+            f.write('<ern:NewReleaseMessage xmlns:ern="http://ddex.net/xml/ern/341"><DealList>%s</DealList>'
+                    '<ReleaseList><Release><ReleaseType>Album</ReleaseType></Release></ReleaseList>'
+                    '</ern:NewReleaseMessage>' % deals)
+        roots = []
+        held = []
+        iterparse = xml.ElementTree.iterparse
+
+        def observed_iterparse(source, events):
+            for (event, value) in iterparse(source, events):
+                if event == 'start' and not roots:
+                    roots.append(value)
+                elif event == 'end' and value.tag == 'DealList':
+                    held.append(len(value))
+                yield (event, value)
+
+        xml.ElementTree.iterparse = observed_iterparse
+        try:
+            for (path, item) in iterparse_xml(self.xml_file, [CI_RELEASE_PATH]):
+                retained = [element.tag for element in roots[0].iter()]
+        finally:
+            xml.ElementTree.iterparse = iterparse
+        # None of the deals are left when their list ends, and only the
+        # release and what leads to it are held when it's reached.
+        self.assertEqual(held, [0])
+        self.assertEqual(retained, ['{http://ddex.net/xml/ern/341}NewReleaseMessage', 'ReleaseList', 'Release', 'ReleaseType'])
+
+    def test_ci_data_items(self):
+        data_items = list(ci_data_items(self.xml_file))
+        self.assertEqual([(data_id, data_type) for (data_id, data_type, data) in data_items],
+                         [('ci/recording/1000001', 'recording'),
+                          ('ci/recording/1000002', 'recording'),
+                          ('ci/release/2000001', 'release')])
+        recording = json.loads(data_items[1][2])
+        details = recording['SoundRecordingDetailsByTerritory']
+        self.assertEqual(details['ResourceContributor'][0]['PartyName']['FullName']['text'], 'Mari')
+        self.assertEqual(details['Comment'], {'text': 'mixed  text', 'b': {'text': 'content'}})
+        release = json.loads(data_items[2][2])
+        self.assertEqual([(ref['_ProprietaryId'], ref['_RecordingName'], ref['_RecordingDuration'])
+                          for ref in release['ReleaseResourceReferenceList']['ReleaseResourceReference']],
+                         [('1000001', 'Holding On', 'PT3M25S'), ('1000002', 'Caged', 'PT1H2M3S')])
+        self.assertEqual(release['ReleaseDetailsByTerritory']['Genre'], [{'GenreText': {'text': 'Electronic'}}])
+
+    def test_ci_data_items_truncated(self):
+        with open(self.xml_file, 'w') as f:
+            f.write(MESSAGE[:MESSAGE.index('<ReleaseList>') + 20])
+        data_items = ci_data_items(self.xml_file)
+        self.assertEqual([next(data_items)[0], next(data_items)[0]], ['ci/recording/1000001', 'ci/recording/1000002'])
+        self.assertRaises(SyntaxError, next, data_items)
@@ -1,6 +1,7 @@
 from flask.ext.script import Manager
 from ..manage import add_folder
-from ..utils import add_data_item
+from ..utils import add_data_items
+from .pipeline import add_files
 from .indexes import index_setup_functions
 
 import_manager = Manager(usage="Import data to geordi.")
@@ -8,8 +9,14 @@ import_manager = Manager(usage="Import data to geordi.")
 # Each command is an index, and each provides its own arguments; we just need
 # to register them all as commands and provide superstructure.
 # Thus, each index will export a setup function taking 'add_folder',
-# 'add_data_item', and 'import_manager', and it should register a command with
-# 'import_manager' for use. It's not unlikely these will be more submanagers.
+# 'add_data_items', 'add_files' and 'import_manager', and it should register a
+# command with 'import_manager' for use. It's not unlikely these will be more
+# submanagers.
+# 'add_data_items' takes an iterable of (data ID, type, data) tuples, so
+# importers should yield data items rather than adding them one by one.
+# 'add_files' adds the data items of many files, given a module-level function
+# yielding a file's data items, optionally parsing and mapping them in worker
+# processes, and keeps a manifest of finished files so imports can resume.
 
 for func in index_setup_functions:
-    func(add_folder, add_data_item, import_manager)
+    func(add_folder, add_data_items, add_files, import_manager)
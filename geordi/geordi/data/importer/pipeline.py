@@ -0,0 +1,145 @@
+from ..model import db
+from ..model.import_file import ImportFile
+from ..utils import DEFAULT_CHUNK_SIZE, map_data_items, _commit_chunks, _add_data_items_counts, _imap_bounded, _ADD_COUNTS_FORMAT
+import hashlib
+import itertools
+import multiprocessing
+import os
+
+#: Number of mapped chunks a worker reading a file may have waiting to be added.
+_QUEUED_CHUNKS = 2
+
+
+def add_files(read_file, files, chunk_size=DEFAULT_CHUNK_SIZE, jobs=1, resume=False, verify=False):
+    '''Add the data items read_file gives for each of files as add_data_items does, read and mapped by
+       jobs worker processes, recording finished files in the import manifest for resume to skip.'''
+    imported = ImportFile.get_states() if resume else {}
+    states = {}
+    finished = []
+    # Files of the data items in the chunk being committed, by data ID, and files with data items that failed.
+    chunk_files = {}
+    failed_files = set()
+    incomplete = []
+
+    def _files_to_read():
+        for file_name in files:
+            path = os.path.abspath(file_name)
+            # Digesting means reading each file twice, so it's only done to verify.
+            state = _file_stat(path) + (_file_digest(path) if verify else None,)
+            recorded = imported.get(path)
+            if recorded is not None and recorded[:2] == state[:2] and (not verify or recorded[2] == state[2]):
+                if recorded[3] == 'imported':
+                    print 'Skipping imported file ' + path
+                    continue
+                print 'Importing %s again, as it was %s last time' % (path, recorded[3])
+            states[path] = state
+            yield path
+
+    def _data_items():
+        for (path, data_items) in _read_files(read_file, _files_to_read(), jobs, chunk_size):
+            status = 'imported'
+            try:
+                for data_item in data_items:
+                    chunk_files.setdefault(data_item[0], set()).add(path)
+                    yield data_item
+            except Exception as e:
+                # Anything before the error has been yielded already.
+                print 'Skipping the rest of %s: %s: %s' % (path, type(e).__name__, e)
+                status = 'partial'
+            finished.append((path, status))
+
+    def _failed(data_item):
+        failed_files.update(chunk_files.get(data_item[0], ()))
+
+    def _record_finished():
+        if finished:
+            records = []
+            for (path, status) in finished:
+                if status == 'imported' and path in failed_files:
+                    status = 'failed'
+                failed_files.discard(path)
+                if status != 'imported':
+                    incomplete.append((path, status))
+                records.append((path,) + states.pop(path) + (status,))
+            ImportFile.record_many(records)
+            db.session.commit()
+            del finished[:]
+        chunk_files.clear()
+
+    counts = {'new': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 0}
+    data_items = _data_items()
+    chunks = iter(lambda: list(itertools.islice(data_items, chunk_size)), [])
+    # A file is only finished once its last data item has been taken for a
+    # chunk, so recording finished files after each commit never records one
+    # with data items still to commit.
+    _commit_chunks(chunks, _add_data_items_counts, counts, _ADD_COUNTS_FORMAT, _record_finished, _failed)
+    _record_finished()
+    for (path, status) in incomplete:
+        print 'Not all of %s was imported (%s); it will be imported again when resuming.' % (path, status)
+    return counts
+
+
+def _read_files(read_file, files, jobs, chunk_size):
+    '''Yield (file name, data items) tuples for files, read and mapped in worker processes if jobs > 1.'''
+    if jobs <= 1:
+        for file_name in files:
+            yield (file_name, _read_file(read_file, file_name))
+        return
+    # Workers never use the database, so there's still just one writer.
+    manager = multiprocessing.Manager()
+    pool = multiprocessing.Pool(jobs)
+    try:
+        tasks = ((read_file, file_name, chunk_size, manager.Queue(_QUEUED_CHUNKS)) for file_name in files)
+        for ((unused, file_name, unused, queue), async_result) in _imap_bounded(pool, _read_and_map_file, tasks, 2 * jobs):
+            yield (file_name, _queued_data_items(queue))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        manager.shutdown()
+
+
+def _read_file(read_file, file_name):
+    '''Yield the data items read_file gives for a file, so any error reading it comes from iterating them.'''
+    for data_item in read_file(file_name):
+        yield data_item
+
+
+def _queued_data_items(queue):
+    '''Yield the data items _read_and_map_file puts in queue, raising the error it stopped with, if any.'''
+    while True:
+        (chunk, error) = queue.get()
+        if error is not None:
+            raise Exception(error)
+        if not chunk:
+            return
+        for data_item in chunk:
+            yield data_item
+
+
+def _file_stat(path):
+    '''Return the (size, modification time in nanoseconds) of a file.'''
+    stat = os.stat(path)
+    # Python 2 only gives modification times as floats, so round to nanoseconds.
+    return (stat.st_size, int(round(stat.st_mtime * 1e9)))
+
+
+def _file_digest(path):
+    '''Return the SHA-1 digest of a file's contents.'''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_and_map_file((read_file, file_name, chunk_size, queue)):
+    '''Map a file's data items in a worker, putting (chunk, error) tuples in queue until an empty chunk.'''
+    try:
+        data_items = iter(read_file(file_name))
+        for chunk in iter(lambda: list(itertools.islice(data_items, chunk_size)), []):
+            queue.put((map_data_items(chunk), None))
+    except Exception as e:
+        queue.put(([], '%s: %s' % (type(e).__name__, e)))
+    else:
+        queue.put(([], None))
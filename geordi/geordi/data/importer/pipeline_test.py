@@ -0,0 +1,120 @@
+from geordi.test_case import GeordiTestCase, sample_data_items, stored_state
+from geordi.data.model.item import Item
+from geordi.data.model.item_data import ItemData
+from geordi.data.model.import_file import ImportFile
+from geordi.data.importer.pipeline import add_files, _read_and_map_file
+from geordi.data.utils import add_data_items
+from geordi.data.model import db
+import Queue
+import json
+import os
+import shutil
+import tempfile
+
+
+def _read_test_file(file_name):
+    with open(file_name) as f:
+        return [tuple(data_item) for data_item in json.load(f)]
+
+
+def _write_test_file(file_name, data_items):
+    with open(file_name, 'w') as f:
+        json.dump(data_items, f)
+
+
+class AddFilesTestCase(GeordiTestCase):
+
+    def setUp(self):
+        super(AddFilesTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.files = []
+        self.data_items = []
+        for index in ['test_index', 'ci']:
+            data_items = list(sample_data_items(index))
+            self.files.append(os.path.join(self.directory, index + '.json'))
+            _write_test_file(self.files[-1], data_items)
+            self.data_items += data_items
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(AddFilesTestCase, self).tearDown()
+
+    def test_add_files(self):
+        add_data_items(self.data_items)
+        expected = stored_state()
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        counts = add_files(_read_test_file, self.files, chunk_size=2, jobs=2)
+        self.assertEqual(counts, {'new': len(self.data_items), 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 2})
+        self.assertEqual(stored_state(), expected)
+        self.assertEqual(sorted(ImportFile.get_states()), self.files[::-1])
+        # Files are only digested to verify them.
+        self.assertEqual([state[2] for state in ImportFile.get_states().values()], [None, None])
+
+    def test_resume_verify(self):
+        # Setting modification times loses any precision beyond microseconds, so do it first.
+        stat = os.stat(self.files[0])
+        os.utime(self.files[0], (stat.st_atime, stat.st_mtime))
+        add_files(_read_test_file, self.files, verify=True)
+
+        # Change a file without changing its size or modification time.
+        with open(self.files[0]) as f:
+            text = f.read()
+        with open(self.files[0], 'w') as f:
+            f.write(text.replace('Mari and the Peaches', 'Mari and the Peachez'))
+        os.utime(self.files[0], (stat.st_atime, stat.st_mtime))
+        self.assertEqual(os.path.getsize(self.files[0]), stat.st_size)
+
+        counts = add_files(_read_test_file, self.files, resume=True)
+        self.assertEqual(counts, {'new': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 0})
+        counts = add_files(_read_test_file, self.files, resume=True, verify=True)
+        # The album has the artist's name too.
+        self.assertEqual(counts['updated'], 2)
+
+    def test_incomplete_files(self):
+        bad = ('unknown/artist/1', 'artist', '{}')
+        _write_test_file(self.files[0], _read_test_file(self.files[0]) + [bad])
+        with open(self.files[1], 'a') as f:
+            f.write('truncated')
+        for jobs in [1, 2]:
+            counts = add_files(_read_test_file, self.files, chunk_size=2, jobs=jobs, resume=True)
+            self.assertEqual(counts['failed'], 1)
+            self.assertEqual(dict((path, state[-1]) for (path, state) in ImportFile.get_states().items()),
+                             {self.files[0]: 'failed', self.files[1]: 'partial'})
+
+        _write_test_file(self.files[0], _read_test_file(self.files[0])[:-1])
+        add_files(_read_test_file, self.files[:1], resume=True)
+        self.assertEqual(ImportFile.get(self.files[0]).status, 'imported')
+
+    def test_read_and_map_file(self):
+        queue = Queue.Queue()
+        _read_and_map_file((_read_test_file, self.files[0], 2, queue))
+        messages = [queue.get() for i in range(queue.qsize())]
+        self.assertEqual(messages[-1], ([], None))
+        self.assertEqual([len(chunk) for (chunk, error) in messages[:-1]], [2, 2])
+        self.assertEqual([data_item[:3] for (chunk, error) in messages for data_item in chunk],
+                         _read_test_file(self.files[0]))
+
+        queue = Queue.Queue()
+        _read_and_map_file((_read_test_file, os.path.join(self.directory, 'missing.json'), 2, queue))
+        self.assertEqual(queue.get()[1][:8], 'IOError:')
+
+    def test_resume(self):
+        add_files(_read_test_file, self.files)
+
+        data_items = _read_test_file(self.files[0])
+        (data_id, data_type, artist) = data_items[1]
+        data_items[1] = (data_id, data_type, json.dumps(dict(json.loads(artist), name='Changed')))
+        _write_test_file(self.files[0], data_items)
+
+        counts = add_files(_read_test_file, self.files, resume=True)
+        self.assertEqual(counts, {'new': 0, 'updated': 1, 'skipped': len(data_items) - 1, 'failed': 0, 'derived': 0})
+        self.assertEqual(Item.get(ItemData.data_to_item(data_id)).map['artist']['name'], ['Changed'])
+
+        counts = add_files(_read_test_file, self.files, resume=True)
+        self.assertEqual(counts, {'new': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 0})
+        counts = add_files(_read_test_file, self.files)
+        self.assertEqual(counts, {'new': 0, 'updated': 0, 'skipped': len(self.data_items), 'failed': 0, 'derived': 0})
@@ -2,6 +2,7 @@ import geordi.data
 import json
 import os
 import re
+import sys
 import logging
 from flask.ext.script import Manager
 from geordi.data.mapping import map_item, verify_map
@@ -50,10 +51,13 @@ def add_data_item(data_id, data_type, data_filename):
     print json.dumps(Item.get(item_id).to_dict(), indent=4)
 
 @data_manager.command
-def add_folder(folder):
+def add_folder(folder, chunk_size=geordi.data.DEFAULT_CHUNK_SIZE):
     '''Add a whole folder. Should be organized by expected data ID, e.g.
        <folder name>/discogs/artist/5.json becomes data item 'discogs/artist/5'
     '''
+    geordi.data.add_data_items(_folder_data_items(folder), int(chunk_size))
+
+def _folder_data_items(folder):
     indices = sorted(os.listdir(folder))
     for index in indices:
         item_types = sorted(os.listdir(folder + '/' + index))
@@ -70,10 +74,20 @@ def add_folder(folder):
                 if re.search('.json$',item):
                     basename = re.sub('.json$', '', item)
                     print "> Adding %s/%s/%s as %s/%s/%s" % (index, item_type, item, index, item_type, basename)
-                    add_data_item('%s/%s/%s' % (index, item_type, basename), data_type, '%s/%s/%s/%s' % (folder, index, item_type, item))
+                    with open('%s/%s/%s/%s' % (folder, index, item_type, item)) as f:
+                        yield ('%s/%s/%s' % (index, item_type, basename), data_type, f.read())
                 else:
                     print ">> File %s/%s/%s not a .json file, skipping" % (index, item_type, item)
 
+@data_manager.command
+def remap(index=None, type=None, chunk_size=geordi.data.DEFAULT_CHUNK_SIZE, jobs=1):
+    '''Map items again from their stored data, where their index's rules have changed since.
+       An item type (as in data IDs) can be given along with an index.'''
+    if type is not None and index is None:
+        print >> sys.stderr, 'An item type can only be given along with an index.'
+        return 1
+    geordi.data.remap_items(index, type, int(chunk_size), int(jobs))
+
 @data_manager.command
 def delete_data_item(data_id):
     print geordi.data.delete_data_item(data_id)
@@ -1,9 +1,15 @@
-from .indexes import index_dict
+from .indexes import index_dict, index_modules
 from .insert import InvalidInsertion, PathInserter, fix_path
+from .trace import RuleTrace, get_tracer
 import re
 import collections
+import hashlib
+import inspect
 import logging
+import random
+import tokenize
 
+from StringIO import StringIO
 from os.path import dirname, abspath
 from jsonschema import Draft4Validator
 import json
@@ -13,74 +19,118 @@ logger = logging.getLogger('geordi.data.mapping')
 def _filter_links(links, path):
     return [link for link in links if (link[0] == path[0] and link[1][:len(path)-1] == path)]
 
-def _replace_ident(link, path, identifier, replace):
-    relevant_entry = link[1][len(path)-1]
-    if isinstance(relevant_entry, tuple) and relevant_entry[1] == identifier:
-        return tuple([link[0], link[1][:len(path)-1] + [replace] + link[1][len(path):]] + list(link[2:]))
-
-def _partition_links(links, path, known_keys):
-    logger.debug('_partition_links %r %r %r', links, path, known_keys)
-    part = dict([(k, []) for k in known_keys])
-    if part.get(None) == []:
-        raise Exception('None is among partition keys, abort')
-    part[None] = []
-    for l in links:
-        cmp_path = [l[0]] + l[1]
-        logger.debug('path for comparison: %r', cmp_path)
-        if len(cmp_path) > len(path) and cmp_path[:len(path)] == path and cmp_path[len(path)] in known_keys:
-            part[cmp_path[len(path)]].append(l)
-        else:
-            part[None].append(l)
-    logger.debug('partitioned links: %r', part)
-    return part
-
 def _tuple_to_link_tuple(t):
     if len(t) >= 3:
         return tuple(t[1:3])
     else:
         return (t[1], t[1])
 
-def _flatten_with_links(data, links, path=[]):
-    logger.debug('_flatten_with_links %r %r %r', data, links, path)
+class _LinkTrie(object):
+    '''
+    Links grouped by their path ([node] + destination), built once per mapped
+    item so that each level of the structure being flattened can pick out the
+    links below each of its keys directly. Links are kept along with their
+    position in the original list, to keep the output in the same order.
+    '''
+    def __init__(self, links=()):
+        self.children = {}
+        self.links = []
+        for (seq, link) in enumerate(links):
+            self.add(seq, link)
+
+    def add(self, seq, link):
+        node = self.child(link[0])
+        for key in link[1]:
+            node = node.child(key)
+        node.links.append((seq, link))
+
+    def child(self, key):
+        node = self.children.get(key)
+        if node is None:
+            node = self.children[key] = _LinkTrie()
+        return node
+
+    def subtree(self):
+        ret = list(self.links)
+        for child in self.children.itervalues():
+            ret.extend(child.subtree())
+        return ret
+
+def _emit_links(links, replacements):
+    '''Sort (seq, link) pairs back into their original order and rewrite ordered list identifiers to indexes.'''
+    ret = []
+    for (seq, link) in sorted(links):
+        if replacements:
+            new_path = list(link[1])
+            for (position, index) in replacements.iteritems():
+                new_path[position] = index
+            link = tuple([link[0], new_path] + list(link[2:]))
+        ret.append(link)
+    return ret
+
+def _unmatched_links(trie, keys, replacements):
+    '''Links ending at this level, or continuing below a key the data doesn't have.'''
+    unmatched = list(trie.links)
+    for (key, child) in trie.children.iteritems():
+        if key not in keys:
+            unmatched.extend(child.subtree())
+    return _emit_links(unmatched, replacements)
+
+def _flatten_with_links(data, links):
+    '''
+    Turn the (value, ordering, identifier) lists produced by insertion into
+    plain lists sorted by ordering, returning the flattened data along with
+    the links, their paths rewritten to use list indexes.
+    '''
+    return _flatten_level(data, _LinkTrie(links), 0, {})
+
+def _flatten_level(data, trie, depth, replacements):
     if isinstance(data, collections.Mapping):
+        if None in data:
+            raise Exception('None is among partition keys, abort')
         ret = {}
         ret_links = []
-        partitioned_links = _partition_links(links, path, data.keys())
         for k in data.keys():
-            new_path = path + [k]
-            (flat, l) = _flatten_with_links(data[k], partitioned_links[k], new_path)
+            child = trie.children.get(k) if trie is not None else None
+            (flat, l) = _flatten_level(data[k], child, depth + 1, replacements)
             ret[k] = flat
             ret_links.extend(l)
-        ret_links.extend(partitioned_links[None])
+        if trie is not None:
+            ret_links.extend(_unmatched_links(trie, data, replacements))
         return (ret, ret_links)
     elif isinstance(data, list):
         ret = []
         ret_links = []
         if len(data) > 0 and isinstance(data[0], tuple):
-            partitioned_links = _partition_links(links, path, [_tuple_to_link_tuple(i) for i in data])
             data_sorted = sorted(data, key=lambda x: x[1])
             for i in range(len(data_sorted)):
-                k = _tuple_to_link_tuple(data_sorted[i])
-                new_links = [_replace_ident(link, path, k[1], i) for link in partitioned_links[k]]
-                new_path = path + [i]
-                (flat, l) = _flatten_with_links(data_sorted[i][0], new_links, new_path)
+                child = trie.children.get(_tuple_to_link_tuple(data_sorted[i])) if trie is not None else None
+                child_replacements = replacements
+                if child is not None:
+                    # the link path doesn't include the node, so it's one shorter
+                    child_replacements = dict(replacements)
+                    child_replacements[depth - 1] = i
+                (flat, l) = _flatten_level(data_sorted[i][0], child, depth + 1, child_replacements)
                 ret.append(flat)
                 ret_links.extend(l)
+            keys = set([_tuple_to_link_tuple(i) for i in data])
         else:
-            partitioned_links = _partition_links(links, path, list(range(len(data))))
             for k in range(len(data)):
-                new_path = path + [k]
-                (flat, l) = _flatten_with_links(data[k], partitioned_links[k], new_path)
+                child = trie.children.get(k) if trie is not None else None
+                (flat, l) = _flatten_level(data[k], child, depth + 1, replacements)
                 ret.append(flat)
                 ret_links.extend(l)
-        ret_links.extend(partitioned_links[None])
+            keys = range(len(data))
+        if trie is not None:
+            ret_links.extend(_unmatched_links(trie, keys, replacements))
         return (ret, ret_links)
+    elif trie is not None:
+        return (data, _emit_links(trie.subtree(), replacements))
     else:
-        return (data, links)
+        return (data, [])
 
 def map_item(item):
     '''Map an item, returning the final mapped data, links, blank nodes, etc.'''
-    logger.debug('map_item %r', item)
     mapped_data = {}
     links = []
     d = None
@@ -96,7 +146,6 @@ def map_item(item):
 
 def map_data_item(data_id, data):
     '''Map a data item, returning the appropriate internal representation for merging/flattening'''
-    logger.debug('map_data_item %r %r', data_id, data)
     (index, item_type, specific_identifier) = data_id.split('/', 2)
     if re.search(':', specific_identifier):  # blank node
         return ({data_id: data},[]) # XXX: inflate with orderings, when implementing merging (links?)
@@ -109,33 +158,100 @@ def map_data_item(data_id, data):
         rules = index_dict.get(index, {}).get(item_type, [])
         if len(rules) == 0:
             raise Exception('no rules found to use')
-        for rule in rules:
-            if rule.test(data):
-                values = rule.run(data)
-                # these are (node, destination, value, link) tuples
-                for value in values:
-                    # put value at destination in node
-                    node = data_id
-                    if value[0] is not None:
-                        node = node + ':' + value[0]
-                    path = fix_path([node] + value[1])
-                    # insert in a separate dict by node, then at provided path
-                    if value[2] is not None:
-                        try:
-                            inserter.insert_data(path, value[2])
-                        except InvalidInsertion as failure:
-                            if value[3] is not None:
-                                logger.info('ignoring an insertion failure since links are provided')
-                            else:
-                                raise failure
-                    # add to links
-                    if value[3] is not None:
-                        # data item ID, node, destination, linked data item
-                        links.append((path[0], path[1:], value[3]))
+        tracer = get_tracer()
+        for (rule_number, rule) in enumerate(rules):
+            # these are (node, destination, value, link) tuples
+            values = rule.evaluate(data)
+            if tracer is not None:
+                values = list(values)
+                failures = []
+            for value in values:
+                # put value at destination in node
+                node = data_id
+                if value[0] is not None:
+                    node = node + ':' + value[0]
+                path = fix_path([node] + value[1])
+                # insert in a separate dict by node, then at provided path
+                if value[2] is not None:
+                    try:
+                        inserter.insert_data(path, value[2])
+                    except InvalidInsertion as failure:
+                        # ignore insertion failures when links are provided
+                        if value[3] is None:
+                            raise failure
+                        elif tracer is not None:
+                            failures.append((path, failure))
+                # add to links
+                if value[3] is not None:
+                    # data item ID, node, destination, linked data item
+                    links.append((path[0], path[1:], value[3]))
+            if tracer is not None:
+                tracer.rule(RuleTrace(data_id, rule_number, rule.source, values, failures))
         return (inserter.get_data(),links)
 
+#: Version of the mapping code, which every rules_version includes. Bump it
+#: by hand whenever a change to the mapping code changes what data maps to.
+ENGINE_VERSION = 1
+
+_rules_versions = {}
+
+def rules_version(index):
+    '''
+    Return a fingerprint of the rules mapping an index, taken from the code
+    of its rules module, leaving out comments and blank lines, and from
+    ENGINE_VERSION, so it changes whenever either of those does.
+    '''
+    version = _rules_versions.get(index)
+    if version is None:
+        digest = hashlib.sha1(str(ENGINE_VERSION))
+        module = index_modules.get(index)
+        if module is not None:
+            digest.update(_code_tokens(inspect.getsource(module)))
+        version = _rules_versions[index] = digest.hexdigest()
+    return version
+
+def _code_tokens(source):
+    '''Return Python source as a string of its tokens other than comments and blank lines.'''
+    tokens = tokenize.generate_tokens(StringIO(source).readline)
+    return '\n'.join(repr(token[:2]) for token in tokens if token[0] not in (tokenize.COMMENT, tokenize.NL))
+
+_validator = None
+
+def _get_validator():
+    '''Returns the mapping schema validator, loading the schema on first use.'''
+    global _validator
+    if _validator is None:
+        with open(dirname(abspath(__file__)) + '/../../schema/mapping.json') as sch_file:
+            schema = json.load(sch_file)
+        _validator = Draft4Validator(schema)
+    return _validator
+
 def verify_map(data):
-    with open(dirname(abspath(__file__)) + '/../../schema/mapping.json') as sch_file:
-        schema = json.load(sch_file)
-    validator = Draft4Validator(schema)
-    return validator.iter_errors(data)
+    return _get_validator().iter_errors(data)
+
+def is_valid_map(data):
+    '''Check a map against the schema without collecting errors.'''
+    return _get_validator().is_valid(data)
+
+#: Which maps should_verify_map selects: 'always', 'off', or a percentage of maps to check at random.
+_validation = 'always'
+
+def set_map_validation(mode):
+    '''
+    Set which maps are validated while importing: 'always', 'off', or a
+    number between 0 and 100, giving the percentage of maps to sample.
+    '''
+    global _validation
+    if mode not in ('always', 'off'):
+        mode = float(mode)
+        if not 0 <= mode <= 100:
+            raise ValueError('Map validation sample percentage must be between 0 and 100, got %r' % mode)
+    _validation = mode
+
+def should_verify_map():
+    if _validation == 'always':
+        return True
+    elif _validation == 'off':
+        return False
+    else:
+        return random.random() * 100 < _validation
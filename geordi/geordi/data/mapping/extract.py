@@ -1,7 +1,5 @@
 import collections
 import copy
-import logging
-logger = logging.getLogger('geordi.data.mapping.extract')
 
 from .pathutils import make_callable, no_op_value
 
@@ -9,8 +7,16 @@ class PathTraversalFailure(Exception):
     pass
 
 class PathExtractor(object):
+    '''
+    A compiled extraction path. Compiling groups plain keys and turns choice
+    tuples into path parts once, so an extractor can be built ahead of time
+    (e.g. by a Rule) and reused across any number of data items.
+    '''
     def __init__(self, path):
-        self.path = self._process_path(path)
+        self.path = tuple(self._process_path(path))
+
+    def __repr__(self):
+        return '<PathExtractor %r>' % (self.path,)
 
     def process_data(self, data):
         produced = [({}, data)]
@@ -44,7 +50,6 @@ class PathExtractor(object):
                     tmp.append(entry)
         if len(tmp) > 0:
             grouped_path.append(PlainPathPart(tmp))
-        logger.debug("Final path is %r", grouped_path)
         return grouped_path
 
 class PathPart(object):
@@ -53,14 +58,14 @@ class PathPart(object):
         self.after = make_callable(after)
 
     def produce_values(self, data):
-        logger.info('PathPart.produce_values %r', data)
         values = []
         for value in data:
             try:
                 vals = self.produce_value((value[0], self.before(value[1])))
                 values.extend([(val[0], self.after(val[1])) for val in vals])
-            except PathTraversalFailure as failure:
-                logger.info('A choice (%r) produced nothing internally: %s', value[0], failure)
+            except PathTraversalFailure:
+                # this choice produced nothing; others may still
+                pass
         if len(values) == 0:
             raise PathTraversalFailure('No results from any choice made thus far.')
         return values
@@ -77,7 +82,6 @@ class PlainPathPart(PathPart):
         return '<PlainPathPart %s>' % self.keys
 
     def produce_value(self, item):
-        logger.info('PlainPathPart.produce_value (%s) %r', self.keys, item)
         tmp_value = item[1]
         for key in self.keys:
             if isinstance(tmp_value, collections.Mapping):
@@ -108,7 +112,6 @@ class ChoicePathPart(PathPart):
             return '<ChoicePathPart (%s, %s)>' % (self.name, self.condition)
 
     def produce_value(self, item):
-        logger.info('ChoicePathPart.produce_value (%s) %r', self.name, item)
         if isinstance(item[1], collections.Mapping):
             all_choices = item[1].keys()
         elif isinstance(item[1], collections.Sized):
@@ -166,8 +169,13 @@ def extract_value(data, path):
     will produce
     [({'bar_index': 1}, 'quuy'), ({'bar_index': 2}, 'quuz')]
 
+    A PathExtractor may be passed in place of the path, to avoid compiling the
+    same path again for every call.
+
     Errors will raise PathTraversalFailure with a descriptive message.
     '''
-    logger.debug('extract_value %r %r', data, path)
-    extractor = PathExtractor(path)
+    if isinstance(path, PathExtractor):
+        extractor = path
+    else:
+        extractor = PathExtractor(path)
     return extractor.process_data(data)
@@ -0,0 +1,26 @@
+from unittest import TestCase
+from geordi.data.mapping.extract import PathExtractor, PathTraversalFailure, extract_value
+
+
+class ExtractTestCase(TestCase):
+
+    def setUp(self):
+        self.data = {'foo': {'bar': [{'baz': 'quux'}, {'baz': 'quuy'}, {'baz': 'quuz'}]}}
+        self.path = ['foo', 'bar', ('bar_index', lambda a: a > 0), 'baz']
+
+    def test_extract_value(self):
+        self.assertListEqual(extract_value(self.data, self.path),
+                             [({'bar_index': 1}, 'quuy'), ({'bar_index': 2}, 'quuz')])
+
+    def test_compiled_extractor(self):
+        extractor = PathExtractor(self.path)
+        self.assertIsInstance(extractor.path, tuple)
+        # the same compiled extractor can be reused for any number of data items
+        self.assertListEqual(extractor.process_data(self.data), extract_value(self.data, self.path))
+        self.assertListEqual(extractor.process_data({'foo': {'bar': [{}, {'baz': 'other'}]}}),
+                             [({'bar_index': 1}, 'other')])
+        self.assertListEqual(extract_value(self.data, extractor), extract_value(self.data, self.path))
+
+    def test_missing_path(self):
+        extractor = PathExtractor(['foo', 'missing'])
+        self.assertRaises(PathTraversalFailure, extractor.process_data, self.data)
@@ -1,11 +1,19 @@
-from test_index import test_index
-from ninjatune import ninjatune
-from ci import ci_index
-from bbc import bbc_index
+import test_index
+import ninjatune
+import ci
+import bbc
 
 index_dict = {
+    'test_index': test_index.test_index,
+    'ninjatune': ninjatune.ninjatune,
+    'ci': ci.ci_index,
+    'bbc': bbc.bbc_index
+}
+
+#: The module defining each index's rules, for fingerprinting them.
+index_modules = {
     'test_index': test_index,
     'ninjatune': ninjatune,
-    'ci': ci_index,
-    'bbc': bbc_index
+    'ci': ci,
+    'bbc': bbc
 }
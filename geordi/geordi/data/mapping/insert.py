@@ -14,31 +14,50 @@ def fix_path(path):
     return [entry.source_value() for entry in path]
 
 class PathInserter(object):
+    '''
+    Builds up a data structure by inserting values at paths. The structure is
+    modified in place; every change made by an insertion is recorded in an undo
+    log, so an insertion that fails part-way is rolled back and leaves the
+    structure as it was.
+    '''
     def __init__(self, data):
         self.data = data
 
     def insert_data(self, path, value):
         path = self._process_path(path)
-        tmp = copy.deepcopy(self.data)
-        for part in path:
-            tmp = part.prepare(tmp)
-
-        if tmp is None:
-            supr = value
-        elif isinstance(tmp, list):
-            logger.warning("Inserting to something that's already a list (%s) is deprecated", tmp)
-            tmp.append(value)
-            supr = tmp
-        else:
-            raise InvalidInsertion('Attempt to insert at an invalid point in a structure.')
+        # values are owned by the structure from here on, so later insertions
+        # below them can't modify the caller's data
+        if isinstance(value, (collections.Mapping, list)):
+            value = copy.deepcopy(value)
+        undo = []
+        try:
+            tmp = self.data
+            for part in path:
+                tmp = part.prepare(tmp)
+
+            if isinstance(tmp, _OrderedList):
+                tmp = tmp.to_list()
+            if tmp is None:
+                supr = value
+            elif isinstance(tmp, list):
+                logger.warning("Inserting to something that's already a list (%s) is deprecated", tmp)
+                undo.append(_undo_extend(tmp))
+                tmp.append(value)
+                supr = tmp
+            else:
+                raise InvalidInsertion('Attempt to insert at an invalid point in a structure.')
 
-        for part in reversed(path):
-            supr = part.insert(supr)
+            for part in reversed(path):
+                supr = part.insert(supr, undo)
+        except Exception:
+            for action in reversed(undo):
+                action()
+            raise
 
         self.data = supr
     
     def get_data(self):
-        return self.data
+        return _finalize(self.data)
 
     def _process_path(self, path):
         final = []
@@ -50,11 +69,79 @@ class PathInserter(object):
             else:
                 final.append(SimplePathPart(entry))
         if not (isinstance(path[-1], tuple) or isinstance(path[-1], PathPart)):
-            logger.debug("Inserting an OrderedPathPart since %s is neither tuple nor PathPart", path[-1])
             final.append(OrderedPathPart())
-        logger.debug("Final path is %r", final)
         return final
 
+def _undo_setitem(container, key):
+    '''Returns a function restoring container[key] to its current state.'''
+    if isinstance(container, collections.Mapping) and key not in container:
+        def undo():
+            del container[key]
+    else:
+        old = container[key]
+        def undo():
+            container[key] = old
+    return undo
+
+def _undo_extend(container):
+    '''Returns a function truncating a list back to its current length.'''
+    length = len(container)
+    def undo():
+        del container[length:]
+    return undo
+
+class _OrderedList(object):
+    '''
+    Internal form of a list of (value, ordering, identifier) tuples while it's
+    being inserted into. Keeps an index of the position of each identifier, so
+    ordered insertions don't need to scan the list; PathInserter.get_data turns
+    these back into plain lists of tuples.
+    '''
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        self.duplicates = set()
+        for (value, ordering, identifier) in items:
+            self.append(value, ordering, identifier)
+
+    def __repr__(self):
+        return '<_OrderedList %r>' % self.items
+
+    def find(self, identifier):
+        if identifier is None:
+            return None
+        return self.positions.get(identifier)
+
+    def append(self, value, ordering, identifier):
+        if identifier is not None:
+            if identifier in self.positions:
+                self.duplicates.add(identifier)
+            else:
+                self.positions[identifier] = len(self.items)
+        self.items.append((value, ordering, identifier))
+
+    def pop(self):
+        (value, ordering, identifier) = self.items.pop()
+        if self.positions.get(identifier) == len(self.items):
+            del self.positions[identifier]
+        return (value, ordering, identifier)
+
+    def to_list(self):
+        return list(self.items)
+
+def _finalize(data):
+    '''Returns a copy of data with all _OrderedLists turned into lists of tuples.'''
+    if isinstance(data, _OrderedList):
+        return [(_finalize(value), ordering, identifier) for (value, ordering, identifier) in data.items]
+    elif isinstance(data, collections.Mapping):
+        return dict([(key, _finalize(value)) for (key, value) in data.iteritems()])
+    elif isinstance(data, list):
+        return [_finalize(value) for value in data]
+    elif isinstance(data, tuple):
+        return tuple([_finalize(value) for value in data])
+    else:
+        return data
+
 class PathPart(object):
     def __init__(self, before=no_op_value, after=no_op_value, no_manip=False):
         self.before = make_callable(before)
@@ -64,7 +151,12 @@ class PathPart(object):
     def prepare(self, data):
         raise Exception('unimplemented')
 
-    def insert(self, supr):
+    def insert(self, supr, undo=None):
+        '''
+        Put supr into the structure found by prepare, returning that structure.
+        Changes to existing structures are recorded in undo, when it is given,
+        as functions reverting them.
+        '''
         raise Exception('unimplemented')
 
     def source_value(self):
@@ -89,7 +181,8 @@ class SimplePathPart(PathPart):
             return self
 
     def prepare(self, data):
-        logger.info('SimplePathPart.prepare (%s) %r', self.key, data)
+        if isinstance(data, _OrderedList):
+            data = data.to_list()
         if data is None:
             self.data = None
             return None
@@ -106,8 +199,7 @@ class SimplePathPart(PathPart):
         else:
             raise InvalidInsertion('Cannot insert data to things that are neither None, a mapping, or a list. Got %r' % data)
 
-    def insert(self, supr):
-        logger.info('SimplePathPart.insert (%s) %r', self.key, supr)
+    def insert(self, supr, undo=None):
         if self.data is None:
             if isinstance(self.key, int):
                 ret = [None for i in range(-1,self.key)]
@@ -116,12 +208,19 @@ class SimplePathPart(PathPart):
             else:
                 return {self.key: supr}
         elif isinstance(self.data, collections.Mapping):
-            self.data[self.key] = supr
+            if self.data.get(self.key) is not supr:
+                if undo is not None:
+                    undo.append(_undo_setitem(self.data, self.key))
+                self.data[self.key] = supr
             return self.data
         elif isinstance(self.data, list):
             logger.warning("Inserting to something that's already a list (%s) is deprecated", self.data)
             if len(self.data) <= self.key:
+                if undo is not None:
+                    undo.append(_undo_extend(self.data))
                 self.data.extend([None for i in range(-1,self.key-len(self.data))])
+            elif undo is not None:
+                undo.append(_undo_setitem(self.data, self.key))
             self.data[self.key] = supr
             return self.data
         else:
@@ -142,54 +241,45 @@ class OrderedPathPart(PathPart):
         return (self.ordering, self.identifier)
 
     def prepare(self, data):
-        logger.info('OrderedPathPart.prepare (%s, %s) %r', self.ordering, self.identifier , data)
-        if not (isinstance(data, list) or data is None):
-            raise InvalidInsertion('Cannot insert an ordered element to things other than lists/None. Got %r' % data)
-        elif isinstance(data, list):
+        if isinstance(data, list):
             if len([True for item in data if not isinstance(item, tuple)]) > 0:
                 raise InvalidInsertion('Attempt to insert an ordering tuple to a list with non-ordered values: %r' % data)
-            self.data = data
-            for item in data:
-                if item[2] == self.identifier and self.identifier is not None:
-                    if self.ordering is not None and item[1] != self.ordering:
-                        raise InvalidInsertion('Bad identifier/ordering: provided identifier %s has ordering %s, but we were given ordering %s' % (self.identifier, item[1], self.ordering))
-                    return item[0]
-            return None
-        else:
-            self.data = []
+            data = _OrderedList(data)
+        elif data is None:
+            data = _OrderedList()
+        elif not isinstance(data, _OrderedList):
+            raise InvalidInsertion('Cannot insert an ordered element to things other than lists/None. Got %r' % data)
+        self.data = data
+        position = data.find(self.identifier)
+        if position is None:
             return None
+        (current, ordering, identifier) = data.items[position]
+        if self.ordering is not None and ordering != self.ordering:
+            raise InvalidInsertion('Bad identifier/ordering: provided identifier %s has ordering %s, but we were given ordering %s' % (self.identifier, ordering, self.ordering))
+        return current
 
-    def insert(self, supr):
-        logger.info('OrderedPathPart.insert (%s, %s) %r', self.ordering, self.identifier , supr)
-        if not isinstance(self.data, list):
+    def insert(self, supr, undo=None):
+        if not isinstance(self.data, _OrderedList):
             raise InvalidInsertion('Cannot insert an ordered element to things other than lists. Got %r' % self.data)
-        else:
-            if len([True for item in self.data if not isinstance(item, tuple)]) > 0:
-                raise InvalidInsertion('Attempt to insert an ordering tuple to a list with non-ordered values: %r' % self.data)
-            if self.identifier is not None:
-                self.inserted = False
-                ret = [self._insert_item(item, supr) for item in self.data]
-                if not self.inserted:
-                    ret.append((supr, self.ordering, self.identifier))
-                return ret
-            else:
-                ret = self.data
-                ret.append((supr, self.ordering, self.identifier))
-                return ret
-
-    def _insert_item(self, item, supr):
-        (current, ordering, identifier) = item
-        if not self.inserted and identifier == self.identifier:
+        if self.identifier in self.data.duplicates:
+            raise InvalidInsertion('Duplicate identifier: %s' % self.identifier)
+        position = self.data.find(self.identifier)
+        if position is not None:
+            (current, ordering, identifier) = self.data.items[position]
             if self.ordering is not None and ordering != self.ordering:
                 raise InvalidInsertion('Bad identifier/ordering: provided identifier %s has ordering %s, but we were given ordering %s' % (self.identifier, ordering, self.ordering))
-            self.inserted = True
-            return (supr, ordering, identifier)
-        elif self.inserted and identifier == self.identifier:
-            raise InvalidInsertion('Duplicate identifier: %s', identifier)
+            if current is not supr:
+                if undo is not None:
+                    undo.append(_undo_setitem(self.data.items, position))
+                self.data.items[position] = (supr, ordering, identifier)
         else:
-            return item
+            if undo is not None:
+                undo.append(self.data.pop)
+            self.data.append(supr, self.ordering, self.identifier)
+        return self.data
 
 def insert_value(data, path, value):
-    inserter = PathInserter(data)
+    '''Insert a value at a path, returning the new data; the data passed in is left unchanged.'''
+    inserter = PathInserter(copy.deepcopy(data))
     inserter.insert_data(path, value)
     return inserter.get_data()
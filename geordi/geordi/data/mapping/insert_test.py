@@ -0,0 +1,56 @@
+from unittest import TestCase
+from geordi.data.mapping.insert import InvalidInsertion, PathInserter, SimplePathPart, insert_value
+
+
+class InsertTestCase(TestCase):
+
+    def test_insert_value(self):
+        data = {'release': {'name': [('Diggin\' It', None, None)]}}
+        result = insert_value(data, ['release', 'mediums', 'split', 'tracks', (1,), 'name'], 'Loungin\'')
+        self.assertDictEqual(result, {'release': {
+            'name': [('Diggin\' It', None, None)],
+            'mediums': {'split': {'tracks': [({'name': [('Loungin\'', None, None)]}, 1, 1)]}}}})
+        # the data passed in is left as it was
+        self.assertDictEqual(data, {'release': {'name': [('Diggin\' It', None, None)]}})
+
+    def test_ordered_identifiers(self):
+        inserter = PathInserter({})
+        inserter.insert_data(['tracks', (2,), 'name'], 'Caged')
+        inserter.insert_data(['tracks', (1,), 'name'], 'Loungin\'')
+        inserter.insert_data(['tracks', (2,), 'length'], 196000)
+        self.assertDictEqual(inserter.get_data(), {'tracks': [
+            ({'name': [('Caged', None, None)], 'length': [(196000, None, None)]}, 2, 2),
+            ({'name': [('Loungin\'', None, None)]}, 1, 1)]})
+        self.assertRaises(InvalidInsertion, inserter.insert_data, ['tracks', (3, 2), 'name'], 'Hey! Listen!')
+
+    def test_existing_ordered_list(self):
+        inserter = PathInserter({'tracks': [({'name': [('Caged', None, None)]}, 2, 2), ({}, 1, 1)]})
+        inserter.insert_data(['tracks', (1,), 'name'], 'Loungin\'')
+        inserter.insert_data(['tracks', (3,), 'name'], 'Hey! Listen!')
+        self.assertDictEqual(inserter.get_data(), {'tracks': [
+            ({'name': [('Caged', None, None)]}, 2, 2),
+            ({'name': [('Loungin\'', None, None)]}, 1, 1),
+            ({'name': [('Hey! Listen!', None, None)]}, 3, 3)]})
+
+    def test_append_to_list(self):
+        inserter = PathInserter({'release': {'tags': ['electronic']}})
+        inserter.insert_data(['release', SimplePathPart('tags')], 'house')
+        self.assertDictEqual(inserter.get_data(), {'release': {'tags': ['electronic', 'house']}})
+
+    def test_inserted_values_are_copied(self):
+        value = {'name': 'Mari'}
+        inserter = PathInserter({})
+        inserter.insert_data(['artists', (0,)], value)
+        inserter.insert_data(['artists', (0,), 'credit'], 'Berry')
+        self.assertDictEqual(value, {'name': 'Mari'})
+
+    def test_rollback(self):
+        data = {'tracks': [({'name': 'Caged'}, 0, 'a'), ({'name': 'Loungin\''}, 1, 'a')]}
+        inserter = PathInserter(data)
+        # the length is set on the first track before the duplicate identifier is found
+        self.assertRaises(InvalidInsertion, inserter.insert_data, ['tracks', (None, 'a'), 'length'], 196000)
+        self.assertDictEqual(inserter.get_data(), {'tracks': [({'name': 'Caged'}, 0, 'a'), ({'name': 'Loungin\''}, 1, 'a')]})
+
+        inserter = PathInserter({'release': {'name': 'Diggin\' It'}})
+        self.assertRaises(InvalidInsertion, inserter.insert_data, ['release', 'name', 'more'], 'Hey')
+        self.assertDictEqual(inserter.get_data(), {'release': {'name': 'Diggin\' It'}})
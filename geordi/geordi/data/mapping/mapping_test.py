@@ -0,0 +1,165 @@
+from unittest import TestCase
+from geordi.test_case import sample_data_items
+from geordi.data import mapping
+from geordi.data.mapping import _code_tokens, _flatten_with_links, _get_validator, is_valid_map, map_data_item, map_item, rules_version, \
+    set_map_validation, should_verify_map, verify_map
+import collections
+import json
+
+
+# The link partitioning _flatten_with_links used before links were grouped into
+# a trie, kept here to check the output hasn't changed.
+def _reference_replace_ident(link, path, identifier, replace):
+    relevant_entry = link[1][len(path)-1]
+    if isinstance(relevant_entry, tuple) and relevant_entry[1] == identifier:
+        return tuple([link[0], link[1][:len(path)-1] + [replace] + link[1][len(path):]] + list(link[2:]))
+
+def _reference_partition_links(links, path, known_keys):
+    part = dict([(k, []) for k in known_keys])
+    part[None] = []
+    for l in links:
+        cmp_path = [l[0]] + l[1]
+        if len(cmp_path) > len(path) and cmp_path[:len(path)] == path and cmp_path[len(path)] in known_keys:
+            part[cmp_path[len(path)]].append(l)
+        else:
+            part[None].append(l)
+    return part
+
+def _reference_tuple_to_link_tuple(t):
+    if len(t) >= 3:
+        return tuple(t[1:3])
+    else:
+        return (t[1], t[1])
+
+def _reference_flatten_with_links(data, links, path=[]):
+    if isinstance(data, collections.Mapping):
+        ret = {}
+        ret_links = []
+        partitioned_links = _reference_partition_links(links, path, data.keys())
+        for k in data.keys():
+            (flat, l) = _reference_flatten_with_links(data[k], partitioned_links[k], path + [k])
+            ret[k] = flat
+            ret_links.extend(l)
+        ret_links.extend(partitioned_links[None])
+        return (ret, ret_links)
+    elif isinstance(data, list):
+        ret = []
+        ret_links = []
+        if len(data) > 0 and isinstance(data[0], tuple):
+            partitioned_links = _reference_partition_links(links, path, [_reference_tuple_to_link_tuple(i) for i in data])
+            data_sorted = sorted(data, key=lambda x: x[1])
+            for i in range(len(data_sorted)):
+                k = _reference_tuple_to_link_tuple(data_sorted[i])
+                new_links = [_reference_replace_ident(link, path, k[1], i) for link in partitioned_links[k]]
+                (flat, l) = _reference_flatten_with_links(data_sorted[i][0], new_links, path + [i])
+                ret.append(flat)
+                ret_links.extend(l)
+        else:
+            partitioned_links = _reference_partition_links(links, path, list(range(len(data))))
+            for k in range(len(data)):
+                (flat, l) = _reference_flatten_with_links(data[k], partitioned_links[k], path + [k])
+                ret.append(flat)
+                ret_links.extend(l)
+        ret_links.extend(partitioned_links[None])
+        return (ret, ret_links)
+    else:
+        return (data, links)
+
+
+def _load_test_data(index):
+    return [(data_id, json.loads(data)) for (data_id, data_type, data) in sample_data_items(index)]
+
+
+class FlattenWithLinksTestCase(TestCase):
+
+    def assertSameFlattening(self, data, links):
+        self.assertEqual(_flatten_with_links(data, links), _reference_flatten_with_links(data, links))
+
+    def test_test_index(self):
+        for (data_id, data) in _load_test_data('test_index'):
+            self.assertSameFlattening(*map_data_item(data_id, data))
+
+    def test_ci(self):
+        for (data_id, data) in _load_test_data('ci'):
+            (mapped, links) = map_data_item(data_id, data)
+            self.assertTrue(len(links) > 0)
+            self.assertSameFlattening(mapped, links)
+
+    def test_unmatched_links(self):
+        data = {'a/b/c': {'release': {
+            'name': [('Diggin\' It', None, None)],
+            'tags': [('electronic', None, None), ('house', None, None)],
+            'tracks': [({'name': [('Caged', None, None)]}, 2, 2), ({'name': [('Loungin\'', None, None)]}, 1, 1)]}}}
+        links = [('a/b/c', ['release', 'tracks', (2, 2), 'name', (None, None)], 'a/b/2'),
+                 ('a/b/c', ['release', 'tags', (None, None)], 'a/b/tag'),
+                 ('a/b/c', ['release', 'missing', (0, 0)], 'a/b/missing'),
+                 ('a/b/c', ['release', 'tracks', (3, 3)], 'a/b/3'),
+                 ('a/b/c', ['release'], 'a/b/release'),
+                 ('a/b/d', ['release', 'name'], 'a/b/other')]
+        self.assertSameFlattening(data, links)
+        self.assertSameFlattening(data, [])
+
+    def test_map_item(self):
+        (mapped, links) = map_item({'data': {'test_index/album/1': dict(_load_test_data('test_index'))['test_index/album/1']}})
+        self.assertListEqual(links, [('test_index/album/1', ['release', 'artists', 'combined', 0], 'test_index/artist/1')])
+        self.assertListEqual(mapped[None]['release']['artists']['combined'],
+                             [{'name': 'Mari and the Peaches', 'credit': 'Berry & Peach'}])
+
+
+class VerifyMapTestCase(TestCase):
+
+    def tearDown(self):
+        set_map_validation('always')
+
+    def test_validator_cached(self):
+        self.assertIs(_get_validator(), _get_validator())
+
+    def test_is_valid_map(self):
+        (mapped, links) = map_item({'data': {'test_index/album/1': dict(_load_test_data('test_index'))['test_index/album/1']}})
+        self.assertTrue(is_valid_map(mapped[None]))
+        self.assertListEqual(list(verify_map(mapped[None])), [])
+
+        invalid = {'release': {'name': 'not a list'}}
+        self.assertFalse(is_valid_map(invalid))
+        self.assertEqual(len(list(verify_map(invalid))), 1)
+
+    def test_map_validation_modes(self):
+        set_map_validation('always')
+        self.assertTrue(all(should_verify_map() for i in range(100)))
+        set_map_validation('off')
+        self.assertFalse(any(should_verify_map() for i in range(100)))
+        set_map_validation(0)
+        self.assertFalse(any(should_verify_map() for i in range(100)))
+        set_map_validation('100')
+        self.assertTrue(all(should_verify_map() for i in range(100)))
+        set_map_validation(50)
+        self.assertTrue(0 < sum(1 for i in range(1000) if should_verify_map()) < 1000)
+        self.assertRaises(ValueError, set_map_validation, 101)
+        self.assertRaises(ValueError, set_map_validation, 'sometimes')
+
+
+class RulesVersionTestCase(TestCase):
+
+    def test_rules_version(self):
+        self.assertEqual(rules_version('ci'), rules_version('ci'))
+        self.assertNotEqual(rules_version('ci'), rules_version('test_index'))
+        # Indexes without rules still depend on the mapping code.
+        self.assertEqual(len(rules_version('unknown')), 40)
+
+    def test_rules_version_engine(self):
+        rules_version('ci')
+        versions = dict(mapping._rules_versions)
+        try:
+            mapping._rules_versions.clear()
+            mapping.ENGINE_VERSION += 1
+            self.assertNotEqual(rules_version('ci'), versions['ci'])
+        finally:
+            mapping.ENGINE_VERSION -= 1
+            mapping._rules_versions.clear()
+            mapping._rules_versions.update(versions)
+
+    def test_code_tokens(self):
+        source = "rules = {\n    'artist': [Rule(['name'], ['artist', 'name'])],\n}\n"
+        commented = "# Artists\nrules = {\n\n    'artist': [Rule(['name'], ['artist', 'name'])],  # names only\n}\n"
+        self.assertEqual(_code_tokens(commented), _code_tokens(source))
+        self.assertNotEqual(_code_tokens(source.replace("'name']", "'title']")), _code_tokens(source))
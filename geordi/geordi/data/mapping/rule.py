@@ -1,4 +1,4 @@
-from .extract import extract_value, PathTraversalFailure
+from .extract import PathExtractor, PathTraversalFailure
 from .pathutils import make_callable, no_op_value
 import logging
 logger = logging.getLogger('geordi.data.mapping.rule')
@@ -8,6 +8,8 @@ class Rule:
                        link=None, link_only=False, transform=no_op_value):
         # source is an extraction path to use
         self.source = source
+        # extractor is the source path compiled once, shared by every run/test
+        self.extractor = PathExtractor(source)
         # destination returns a simple path array for the destination
         self.destination = make_callable(destination)
         # node_destination returns a node (or None, for "this one") the destination applies to
@@ -22,8 +24,23 @@ class Rule:
 
     def run(self, data):
         '''Runs the rule, producing an array of (node, destination, value, link) tuples'''
-        extracted_values = extract_value(data, self.source)
-        values = []
+        extracted_values = self.extractor.process_data(data)
+        return list(self._produce_values(extracted_values, data))
+
+    def evaluate(self, data):
+        '''
+        Tests and runs the rule in a single pass, yielding the same
+        (node, destination, value, link) tuples as run. The source is extracted
+        and each condition checked only once; where test would fail, nothing
+        is yielded.
+        '''
+        try:
+            extracted_values = self.extractor.process_data(data)
+        except PathTraversalFailure:
+            return iter(())
+        return self._produce_values(extracted_values, data)
+
+    def _produce_values(self, extracted_values, data):
         for (choices, value) in extracted_values:
             if self.condition(value, data, **choices):
                 node = self.node_destination(value, data, **choices)
@@ -33,22 +50,19 @@ class Rule:
                     value = None
                 else:
                     value = self.transform(value, data, **choices)
-                values.append((node, destination, value, link))
-        return values
+                yield (node, destination, value, link)
 
     def test(self, data):
         '''Tests that the source field exists and matches any conditions and returns True or False'''
         still_ok = True
         try:
-            values = extract_value(data, self.source)
-        except PathTraversalFailure as failure:
-            logger.info('Testing failed due to PathTraversalFailure: %s', failure)
+            values = self.extractor.process_data(data)
+        except PathTraversalFailure:
             still_ok = False
         if still_ok:
             still_ok = False
             for (choices, value) in values:
                 if self.condition(value, data, **choices):
                     still_ok = True
-                    logger.info('Rule ok for %r, %r, %r', value, data, choices)
                     break
         return still_ok
@@ -0,0 +1,31 @@
+from unittest import TestCase
+from geordi.data.mapping.rule import Rule
+
+
+class RuleTestCase(TestCase):
+
+    def setUp(self):
+        self.data = {'title': 'Diggin\' It',
+                     'tracks': [{'title': 'Hey! Listen!', 'duration': '185'}, {'title': 'Caged', 'duration': '196'}]}
+        self.rule = Rule(['tracks', ('t_index', True), 'duration'],
+                         lambda *args, **kwargs: ['release', 'mediums', 'split', 'tracks', (kwargs.get('t_index'),), 'length'],
+                         condition=lambda value, *args, **kwargs: value != '196',
+                         transform=lambda value, *args, **kwargs: int(value) * 1000)
+
+    def test_run(self):
+        self.assertTrue(self.rule.test(self.data))
+        self.assertListEqual(self.rule.run(self.data),
+                             [(None, ['release', 'mediums', 'split', 'tracks', (0,), 'length'], 185000, None)])
+
+    def test_evaluate(self):
+        self.assertListEqual(list(self.rule.evaluate(self.data)), self.rule.run(self.data))
+
+    def test_evaluate_missing_source(self):
+        data = {'title': 'No tracks'}
+        self.assertFalse(self.rule.test(data))
+        self.assertListEqual(list(self.rule.evaluate(data)), [])
+
+    def test_evaluate_failed_condition(self):
+        data = {'tracks': [{'duration': '196'}]}
+        self.assertFalse(self.rule.test(data))
+        self.assertListEqual(list(self.rule.evaluate(data)), [])
@@ -0,0 +1,43 @@
+import collections
+import logging
+
+logger = logging.getLogger('geordi.data.mapping.trace')
+
+#: A record of one rule applied to one data item: the values it produced, as
+#: (node, destination, value, link) tuples, and the insertions that failed but
+#: were ignored since a link was provided, as (path, exception) tuples.
+RuleTrace = collections.namedtuple('RuleTrace', ['data_id', 'rule_number', 'source', 'values', 'failures'])
+
+class MappingTracer(object):
+    '''
+    Receives trace records while data items are being mapped. Mapping only
+    builds records when a tracer is set (see set_tracer), so tracing costs
+    nothing otherwise. Subclass this to collect or report records.
+    '''
+    def rule(self, record):
+        pass
+
+class LoggingTracer(MappingTracer):
+    '''Logs a summary of each rule applied, and the values it produced.'''
+    def __init__(self, logger=logger, level=logging.DEBUG):
+        self.logger = logger
+        self.level = level
+
+    def rule(self, record):
+        self.logger.log(self.level, '%s rule %d %r: %d value(s), %d ignored failure(s)',
+                        record.data_id, record.rule_number, record.source,
+                        len(record.values), len(record.failures))
+        for (node, destination, value, link) in record.values:
+            self.logger.log(self.level, '    %s %r = %r (link: %r)', node or '-', destination, value, link)
+        for (path, failure) in record.failures:
+            self.logger.log(self.level, '    ignored failure at %r: %s', path, failure)
+
+_tracer = None
+
+def set_tracer(tracer):
+    '''Set the tracer used for all mapping from now on, or None to disable tracing.'''
+    global _tracer
+    _tracer = tracer
+
+def get_tracer():
+    return _tracer
@@ -0,0 +1,43 @@
+from unittest import TestCase
+from geordi.data.mapping import map_data_item
+from geordi.data.mapping.trace import MappingTracer, get_tracer, set_tracer
+
+
+class CollectingTracer(MappingTracer):
+    def __init__(self):
+        self.records = []
+
+    def rule(self, record):
+        self.records.append(record)
+
+
+class TraceTestCase(TestCase):
+
+    def setUp(self):
+        self.data = {'id': 1, 'title': 'Diggin\' It', 'artists': [{'id': 1, 'name': 'Mari and the Peaches'}]}
+
+    def tearDown(self):
+        set_tracer(None)
+
+    def test_no_tracer(self):
+        self.assertIsNone(get_tracer())
+        map_data_item('test_index/album/1', self.data)
+
+    def test_rule_records(self):
+        tracer = CollectingTracer()
+        set_tracer(tracer)
+        map_data_item('test_index/album/1', self.data)
+
+        # one record per rule, including those which produced nothing
+        self.assertListEqual([record.rule_number for record in tracer.records], [0, 1, 2, 3])
+        self.assertTrue(all(record.data_id == 'test_index/album/1' for record in tracer.records))
+
+        title = tracer.records[0]
+        self.assertListEqual(title.source, ['title'])
+        self.assertListEqual(title.values, [(None, ['release', 'name'], 'Diggin\' It', None)])
+        self.assertListEqual(title.failures, [])
+
+        self.assertListEqual(tracer.records[1].values, [])
+
+        artists = tracer.records[3]
+        self.assertListEqual([value[3] for value in artists.values], ['test_index/artist/1'])
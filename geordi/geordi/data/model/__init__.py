@@ -20,6 +20,7 @@ def create_tables(app):
 
 from .csrf import CSRF
 from .editor import Editor
+from .import_file import ImportFile
 from .item import Item
 from .item_data import ItemData
 from .item_redirect import ItemRedirect
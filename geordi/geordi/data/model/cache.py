@@ -0,0 +1,36 @@
+"""
+geordi.data.model.cache
+-----------------------
+
+A bounded cache for values the models look up or work out over and over.
+"""
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A mapping holding at most size entries, dropping the least recently used first."""
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get_many(self, keys):
+        """Return a dict of those keys that are cached, marking them as recently used."""
+        found = {}
+        for key in keys:
+            if key in self.entries:
+                found[key] = self.entries[key] = self.entries.pop(key)
+        return found
+
+    def update(self, entries):
+        for (key, value) in entries.iteritems():
+            self.entries.pop(key, None)
+            self.entries[key] = value
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
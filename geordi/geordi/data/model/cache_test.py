@@ -0,0 +1,17 @@
+from unittest import TestCase
+from geordi.data.model.cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.update({'a': 1, 'b': 2})
+        self.assertEqual(cache.get_many(['a', 'c']), {'a': 1})
+        # 'b' is now the least recently used.
+        cache.update({'c': 3})
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        cache.discard(['a'])
+        self.assertEqual(cache.get_many(['a', 'c']), {'c': 3})
+        cache.clear()
+        self.assertEqual(cache.get_many(['c']), {})
@@ -0,0 +1,48 @@
+"""
+geordi.data.model.import_file
+-----------------------------
+"""
+from . import db
+
+
+class ImportFile(db.Model):
+    """Model for the 'import_file' table, a manifest of the files importers have finished with, so imports can resume."""
+    __tablename__ = 'import_file'
+    __table_args__ = {'schema': 'geordi'}
+
+    #: Absolute path of the imported file.
+    path = db.Column(db.Unicode, primary_key=True)
+    #: Size of the file in bytes when it was imported.
+    size = db.Column(db.BigInteger, nullable=False)
+    #: Modification time of the file, in whole nanoseconds since the epoch, when it was imported. Kept as an integer
+    #: so it reads back exactly as it was written, which a float isn't guaranteed to.
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    #: SHA-1 digest of the file's contents when it was imported, if it was imported with --verify.
+    digest = db.Column(db.Unicode)
+    #: How far importing the file got: 'imported' if all its data items were added, 'failed' if some of them failed,
+    #: or 'partial' if reading it failed partway.
+    status = db.Column(db.Unicode, nullable=False)
+
+    @classmethod
+    def get(cls, path):
+        return cls.query.filter_by(path=path).first()
+
+    @staticmethod
+    def get_states():
+        """Return a dict mapping the path of every file in the manifest to a (size, mtime_ns, digest, status) tuple."""
+        result = db.session.execute("SELECT path, size, mtime_ns, digest, status FROM geordi.import_file")
+        return dict((row[0], tuple(row[1:])) for row in result)
+
+    @staticmethod
+    def record_many(files):
+        """Add or replace manifest entries from (path, size, mtime_ns, digest, status) tuples with a single statement."""
+        if not files:
+            return
+        (paths, sizes, mtimes, digests, statuses) = zip(*files)
+        db.session.execute("INSERT INTO geordi.import_file (path, size, mtime_ns, digest, status) "
+                           "SELECT * FROM unnest(CAST(:paths AS text[]), CAST(:sizes AS bigint[]), CAST(:mtimes AS bigint[]), "
+                           "                     CAST(:digests AS text[]), CAST(:statuses AS text[])) "
+                           "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                           "                                 digest = excluded.digest, status = excluded.status",
+                           {'paths': list(paths), 'sizes': list(sizes), 'mtimes': list(mtimes),
+                            'digests': list(digests), 'statuses': list(statuses)})
@@ -0,0 +1,18 @@
+from geordi.test_case import GeordiTestCase
+from geordi.data.model.import_file import ImportFile
+from . import db
+
+
+class ImportFileTestCase(GeordiTestCase):
+
+    def test_record_many(self):
+        self.assertEqual(ImportFile.get_states(), {})
+
+        ImportFile.record_many([(u'/data/a.xml', 10, 1400000000500000000, u'aaa', u'imported'),
+                                (u'/data/b.xml', 20, 1400000001250000001, u'bbb', u'imported')])
+        ImportFile.record_many([(u'/data/a.xml', 11, 1400000002000000000, u'ccc', u'imported')])
+        db.session.commit()
+
+        self.assertEqual(ImportFile.get_states(), {'/data/a.xml': (11, 1400000002000000000, 'ccc', 'imported'),
+                                                   '/data/b.xml': (20, 1400000001250000001, 'bbb', 'imported')})
+        self.assertEqual(ImportFile.get(u'/data/b.xml').digest, 'bbb')
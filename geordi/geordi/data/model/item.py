@@ -3,8 +3,26 @@ geordi.data.model.item
 ----------------------
 """
 from . import db
+from .jsonb import JSONB
 from .mixins import DeleteMixin
-import json
+
+#: Columns and relationships loaded by each of Item.load_options's profiles.
+_LOAD_PROFILES = {
+    'summary': (['id', 'type', 'map_version'], []),
+    'map_only': (['id', 'type', 'map', 'map_version'], []),
+    'full': (['id', 'type', 'map', 'map_version'], ['item_data', 'item_links']),
+}
+
+#: Most redirects followed from one item ID, in case they ever form a loop.
+_MAX_REDIRECTS = 100
+
+#: SQL building, for an item aliased as i, the JSON that Item.to_dict gives.
+_ITEM_JSON = ("json_build_object("
+              "  'id', i.id, 'type', i.type, 'map', coalesce(i.map, '{}'), "
+              "  'data', coalesce((SELECT jsonb_object_agg(d.id, d.data) "
+              "                    FROM geordi.item_data d WHERE d.item = i.id), '{}'), "
+              "  'links', coalesce((SELECT jsonb_object_agg(l.type, l.linked) "
+              "                     FROM geordi.item_link l WHERE l.item = i.id), '{}'))")
 
 
 class Item(db.Model, DeleteMixin):
@@ -16,17 +34,19 @@ class Item(db.Model, DeleteMixin):
     id = db.Column(db.Integer, primary_key=True)
     #: Nominal type guess for this item.
     type = db.Column(db.Unicode)
-    #: Mapped data for this item, JSON.
-    map = db.Column(db.UnicodeText)
+    #: Mapped data for this item, parsed from JSON.
+    map = db.Column(JSONB)
+    #: Version of the rules the map was made with, from geordi.data.mapping.rules_version.
+    map_version = db.Column(db.Unicode)
 
-    #: Property for data items linked to this item. Included by default when loading.
-    item_data = db.relationship('ItemData', lazy='joined', cascade='delete', backref='item')
+    #: Property for data items linked to this item. Not loaded by default; see load_options.
+    item_data = db.relationship('ItemData', cascade='delete', backref='item')
     #: Property for redirects to this item.
     item_redirects = db.relationship('ItemRedirect', cascade='delete', backref='new')
 
     # Item links
-    #: Property for links from this item to other items. Included by default when loading.
-    item_links = db.relationship('ItemLink', lazy='joined', cascade='delete', backref='item', foreign_keys='ItemLink.item_id')
+    #: Property for links from this item to other items. Not loaded by default; see load_options.
+    item_links = db.relationship('ItemLink', cascade='delete', backref='item', foreign_keys='ItemLink.item_id')
     #: Property for links from other items to this item. Not loaded by default.
     items_linked = db.relationship('ItemLink', cascade='delete', backref='linked', foreign_keys='ItemLink.linked_id')
 
@@ -36,19 +56,75 @@ class Item(db.Model, DeleteMixin):
 
     @property
     def map_dict(self):
-        return json.loads(self.map) if self.map is not None else dict()
+        return self.map if self.map is not None else dict()
 
     def to_dict(self):
         response = dict(id=self.id,
                         type=self.type,
                         map=self.map_dict,
-                        data=dict([(i.id, json.loads(i.data)) for i in self.item_data]),
+                        data=dict([(i.id, i.data) for i in self.item_data]),
                         links=dict([(i.type, i.linked_id) for i in self.item_links]))
         return response
 
     @classmethod
-    def get(cls, item_id, **kwargs):
-        return cls.query.filter_by(id=item_id, **kwargs).first()
+    def get(cls, item_id, load='full', **kwargs):
+        return cls.query.filter_by(id=item_id, **kwargs).options(*cls.load_options(load)).first()
+
+    @classmethod
+    def load_options(cls, profile, via=None):
+        """
+        Return query options loading items by a profile: 'summary' loads just
+        their types, 'map_only' their maps as well, and 'full' their data
+        items and links too, each with one more query rather than joined, so
+        data and links don't multiply each other's rows. Given a loader for a
+        relationship to items as via, the options apply to the items loaded
+        through it.
+        """
+        (columns, relationships) = _LOAD_PROFILES[profile]
+        if via is None:
+            via = db.Load(cls)
+        return [via.load_only(*columns)] + [via.subqueryload(relationship) for relationship in relationships]
+
+    @staticmethod
+    def get_json(item_id):
+        """
+        Return the same as to_dict gives for an item, as JSON text built by the
+        database from the stored JSON, or None if there's no such item.
+        """
+        result = db.session.execute("SELECT CAST(%s AS text) FROM geordi.item i WHERE i.id = :id" % _ITEM_JSON,
+                                    {'id': item_id})
+        row = result.fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def get_json_many(item_ids):
+        """
+        Return JSON text, built by the database with one query, of an object
+        with 'items', mapping each of the given item IDs to what get_json gives
+        for it (or null if there's no such item), and 'redirects', mapping the
+        given IDs of items that were merged into others to the IDs of those.
+        Merged items are given as the items they were finally merged into,
+        following redirects to redirected items to their end.
+        """
+        result = db.session.execute("WITH RECURSIVE r (old, new, depth) AS ("
+                                    "  SELECT old, new, 1 FROM geordi.item_redirect WHERE old = ANY(:ids) "
+                                    "  UNION ALL "
+                                    "  SELECT r.old, n.new, r.depth + 1 "
+                                    "  FROM r JOIN geordi.item_redirect n ON n.old = r.new "
+                                    "  WHERE r.depth < :max_depth"
+                                    "), last AS ("
+                                    "  SELECT DISTINCT ON (old) old, new FROM r ORDER BY old, depth DESC"
+                                    ") "
+                                    "SELECT CAST(json_build_object("
+                                    "  'items', coalesce(json_object_agg(v.id, j.item), '{}'), "
+                                    "  'redirects', coalesce(json_object_agg(v.id, r.new) FILTER (WHERE r.new IS NOT NULL), '{}')"
+                                    ") AS text) "
+                                    "FROM unnest(CAST(:ids AS integer[])) AS v (id) "
+                                    "LEFT JOIN last r ON r.old = v.id "
+                                    "LEFT JOIN LATERAL (SELECT %s AS item FROM geordi.item i "
+                                    "                   WHERE i.id = coalesce(r.new, v.id)) j ON TRUE" % _ITEM_JSON,
+                                    {'ids': list(item_ids), 'max_depth': _MAX_REDIRECTS})
+        return result.fetchone()[0]
 
     @classmethod
     def create(cls, type=None, map=None):
@@ -56,3 +132,29 @@ class Item(db.Model, DeleteMixin):
         db.session.add(item)
         db.session.flush()
         return item
+
+    @staticmethod
+    def create_many(types):
+        """Create an item for each of the given types, returning the new IDs in the same order."""
+        if not types:
+            return []
+        result = db.session.execute("SELECT nextval(pg_get_serial_sequence('geordi.item', 'id')) "
+                                    "FROM generate_series(1, :count)",
+                                    {'count': len(types)})
+        ids = [row[0] for row in result]
+        db.session.execute("INSERT INTO geordi.item (id, type) "
+                           "SELECT * FROM unnest(CAST(:ids AS integer[]), CAST(:types AS text[]))",
+                           {'ids': ids, 'types': list(types)})
+        return ids
+
+    @staticmethod
+    def update_maps(maps):
+        """Set the mapped data of several items at once, given a dict of item IDs to (map JSON, rules version) tuples."""
+        if not maps:
+            return
+        (map_json, versions) = zip(*maps.values())
+        db.session.execute("UPDATE geordi.item SET map = CAST(v.map AS jsonb), map_version = v.version "
+                           "FROM unnest(CAST(:ids AS integer[]), CAST(:maps AS text[]), CAST(:versions AS text[])) "
+                           "     AS v (id, map, version) "
+                           "WHERE item.id = v.id",
+                           {'ids': maps.keys(), 'maps': list(map_json), 'versions': list(versions)})
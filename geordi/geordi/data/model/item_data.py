@@ -3,20 +3,61 @@ geordi.data.model.item_data
 ---------------------------
 """
 from . import db
+from .cache import LRUCache
+from .item import Item
+from .jsonb import JSONB
 from .mixins import DeleteMixin
+from contextlib import contextmanager
+import json
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+#: Cache of data IDs resolved to item IDs, while ItemData.caching_item_ids is in use.
+_item_ids = None
+
+
+def split_data_id(data_id):
+    """Split a data ID into its (index, item type, identifier) parts."""
+    parts = data_id.split('/', 2)
+    return (parts[0], parts[1] if len(parts) > 1 else u'', parts[2] if len(parts) > 2 else None)
+
+
+def _data_id_part(part):
+    return lambda context: split_data_id(context.current_parameters['id'])[part]
+
+
+def _item_ids_query(after):
+    return ("SELECT local_id FROM geordi.item_data "
+            "WHERE index = :index AND item_type = :item_type AND local_id IS NOT NULL " +
+            ("AND local_id > :after " if after is not None else "") +
+            "ORDER BY local_id")
+
+
+def _discard_item_ids(data_ids):
+    if _item_ids is not None:
+        _item_ids.discard(data_ids)
 
 
 class ItemData(db.Model, DeleteMixin):
     """Model for the 'item_data' table, storing index-specific raw data."""
     __tablename__ = 'item_data'
-    __table_args__ = {'schema': 'geordi'}
+    __table_args__ = (db.Index('item_data_idx_index_item_type_local_id', 'index', 'item_type', 'local_id'),
+                      {'schema': 'geordi'})
 
     #: Data item identifier of the form (index)/(item type)/(identifier).
     id = db.Column(db.Unicode, primary_key=True)
+    #: The index part of the data item identifier, kept separately for listing by index.
+    index = db.Column(db.Unicode, nullable=False, default=_data_id_part(0))
+    #: The item type part of the data item identifier.
+    item_type = db.Column(db.Unicode, nullable=False, default=_data_id_part(1))
+    #: The identifier part of the data item identifier, within its index and item type.
+    local_id = db.Column(db.Unicode, default=_data_id_part(2))
     #: Item ID of the item to which this data item belongs.
     item_id = db.Column('item', db.Integer, db.ForeignKey('geordi.item.id', ondelete='CASCADE'), nullable=False)
-    #: Raw JSON data.
-    data = db.Column(db.UnicodeText)
+    #: Raw data, parsed from JSON.
+    data = db.Column(JSONB)
+    #: Digest of the raw JSON as it was given, so unchanged data can be skipped on reimport.
+    digest = db.Column(db.Unicode)
 
     def to_dict(self):
         return {'id': self.id, 'item_id': self.item_id, 'data': self.data}
@@ -32,52 +73,188 @@ class ItemData(db.Model, DeleteMixin):
     @classmethod
     def data_to_item(cls, data_id):
         """Resolve a data ID to its associated item ID, if it has one (it should)."""
-        item_data = cls.get(data_id)
-        if item_data is not None:
-            return item_data.item_id
-        else:
-            return None
+        return cls.data_to_items([data_id]).get(data_id)
+
+    @classmethod
+    def data_to_items(cls, data_ids):
+        """
+        Resolve several data IDs at once, returning a dict mapping those that
+        have items to their item IDs. Only the IDs are selected, never the data.
+        """
+        data_ids = set(data_ids)
+        found = _item_ids.get_many(data_ids) if _item_ids is not None else {}
+        missing = list(data_ids.difference(found))
+        if missing:
+            resolved = dict(db.session.query(cls.id, cls.item_id)
+                            .filter(db.text("geordi.item_data.id = ANY(:ids)")).params(ids=missing))
+            if _item_ids is not None:
+                _item_ids.update(resolved)
+            found.update(resolved)
+        return found
+
+    @staticmethod
+    @contextmanager
+    def caching_item_ids(size):
+        """
+        Within a with block, remember up to size data IDs resolved by
+        data_to_item and data_to_items. Entries are dropped when their data
+        items are changed through this model, and all of them when a
+        transaction is rolled back, but changes made by other processes go
+        unnoticed, so this is meant for bulk work such as importing.
+        """
+        global _item_ids
+        previous = _item_ids
+        _item_ids = LRUCache(size)
+        try:
+            yield
+        finally:
+            _item_ids = previous
+
+    @classmethod
+    def data_to_items_with_digests(cls, data_ids):
+        """Like data_to_items, but map data IDs to (item ID, digest, item map version) tuples."""
+        data_ids = list(data_ids)
+        if not data_ids:
+            return {}
+        return dict((data_id, (item_id, digest, map_version)) for (data_id, item_id, digest, map_version)
+                    in db.session.query(cls.id, cls.item_id, cls.digest, Item.map_version)
+                                 .join(Item, Item.id == cls.item_id).filter(cls.id.in_(data_ids)))
 
     @classmethod
     def create(cls, item_id, data_json, data_id):
-        item_data = cls(item_id=item_id, data=data_json, id=data_id)
+        _discard_item_ids([data_id])
+        item_data = cls(item_id=item_id, data=json.loads(data_json), id=data_id)
         db.session.add(item_data)
         db.session.flush()
         return item_data
 
     @classmethod
     def update(cls, item_id, data, data_id):
+        _discard_item_ids([data_id])
         item_data = cls.get(data_id)
         item_data.item_id = item_id
-        item_data.data = data
+        item_data.data = json.loads(data)
         db.session.flush()
         return item_data
 
+    @staticmethod
+    def create_many(data_items):
+        """Insert (item ID, data, data ID, digest) tuples with a single statement."""
+        if not data_items:
+            return
+        (item_ids, data, data_ids, digests) = zip(*data_items)
+        _discard_item_ids(data_ids)
+        (indexes, item_types, local_ids) = zip(*[split_data_id(data_id) for data_id in data_ids])
+        db.session.execute("INSERT INTO geordi.item_data (id, item, data, digest, index, item_type, local_id) "
+                           "SELECT id, item, CAST(data AS jsonb), digest, index, item_type, local_id "
+                           "FROM unnest(CAST(:ids AS text[]), CAST(:items AS integer[]), CAST(:data AS text[]), "
+                           "            CAST(:digests AS text[]), CAST(:indexes AS text[]), "
+                           "            CAST(:item_types AS text[]), CAST(:local_ids AS text[])) "
+                           "     AS v (id, item, data, digest, index, item_type, local_id)",
+                           {'ids': list(data_ids), 'items': list(item_ids), 'data': list(data), 'digests': list(digests),
+                            'indexes': list(indexes), 'item_types': list(item_types), 'local_ids': list(local_ids)})
+
+    @staticmethod
+    def update_many(data_items):
+        """Update existing data items from (item ID, data, data ID, digest) tuples with a single statement."""
+        if not data_items:
+            return
+        (item_ids, data, data_ids, digests) = zip(*data_items)
+        _discard_item_ids(data_ids)
+        db.session.execute("UPDATE geordi.item_data SET item = v.item, data = CAST(v.data AS jsonb), digest = v.digest "
+                           "FROM unnest(CAST(:ids AS text[]), CAST(:items AS integer[]), CAST(:data AS text[]), "
+                           "            CAST(:digests AS text[])) AS v (id, item, data, digest) "
+                           "WHERE item_data.id = v.id",
+                           {'ids': list(data_ids), 'items': list(item_ids), 'data': list(data), 'digests': list(digests)})
+
+    @staticmethod
+    def get_stale(index, item_type, version, after=None, limit=None):
+        """
+        Return (data ID, item ID, JSON) tuples for data items in an index, and
+        optionally of one item type, whose items were mapped with rules other
+        than the given version. Link placeholders and blank nodes, which are
+        mapped along with other data items, are left out. Results are ordered by
+        item type and identifier, starting after the data ID given.
+        """
+        (unused, after_type, after_local_id) = split_data_id(after) if after is not None else (None, None, None)
+        # Scanning the listing index for just the index stops at its end, where the primary key wouldn't.
+        result = db.session.execute("SELECT d.id, d.item, CAST(d.data AS text) "
+                                    "FROM geordi.item_data d JOIN geordi.item i ON i.id = d.item "
+                                    "WHERE d.index = :index AND d.local_id IS NOT NULL " +
+                                    ("AND d.item_type = :item_type " if item_type is not None else "") +
+                                    ("AND (d.item_type, d.local_id) > (:after_type, :after_local_id) " if after is not None else "") +
+                                    "  AND d.data <> '{}' "
+                                    "  AND strpos(d.local_id, ':') = 0 "
+                                    "  AND i.map_version IS DISTINCT FROM :version "
+                                    "ORDER BY d.item_type, d.local_id "
+                                    "LIMIT :limit",
+                                    {'index': index, 'item_type': item_type, 'after_type': after_type,
+                                     'after_local_id': after_local_id, 'version': version, 'limit': limit})
+        return [tuple(row) for row in result.fetchall()]
+
+    # Postgres has no skip scan, so the distinct indexes and item types are
+    # found by repeatedly looking up the next one in the index, rather than by
+    # reading every row.
+
     @staticmethod
     def get_indexes():
-        result = db.session.execute("SELECT DISTINCT regexp_replace(id, '/.*$', '') n FROM geordi.item_data ORDER BY n")
+        result = db.session.execute("WITH RECURSIVE t (n) AS ("
+                                    "  (SELECT index FROM geordi.item_data ORDER BY index LIMIT 1) "
+                                    "  UNION ALL "
+                                    "  SELECT (SELECT index FROM geordi.item_data WHERE index > t.n ORDER BY index LIMIT 1) "
+                                    "  FROM t WHERE t.n IS NOT NULL"
+                                    ") SELECT n FROM t WHERE n IS NOT NULL")
         return [i[0] for i in result]
 
     @staticmethod
     def get_item_types_by_index(index):
-        result = db.session.execute("SELECT DISTINCT regexp_replace(id, '^[^/]*/([^/]*)/.*$', '\\1') n "
-                                    "FROM geordi.item_data "
-                                    "WHERE id ~ ('^' || :index || '/') "
-                                    "ORDER BY n",
+        result = db.session.execute("WITH RECURSIVE t (n) AS ("
+                                    "  (SELECT item_type FROM geordi.item_data WHERE index = :index ORDER BY item_type LIMIT 1) "
+                                    "  UNION ALL "
+                                    "  SELECT (SELECT item_type FROM geordi.item_data "
+                                    "          WHERE index = :index AND item_type > t.n ORDER BY item_type LIMIT 1) "
+                                    "  FROM t WHERE t.n IS NOT NULL"
+                                    ") SELECT n FROM t WHERE n IS NOT NULL",
                                     {'index': index})
         return [i[0] for i in result.fetchall()]
 
     @staticmethod
-    def get_item_ids(index, item_type):
-        result = db.session.execute("SELECT DISTINCT regexp_replace(id, '^[^/]*/[^/]*/(.*)$', '\\1') n "
-                                    "FROM geordi.item_data "
-                                    "WHERE id ~ ('^' || :index || '/' || :item_type || '/') "
-                                    "ORDER BY n",
-                                    {'index': index, 'item_type': item_type})
+    def get_item_ids(index, item_type, after=None, limit=None):
+        """
+        Return the identifiers of the data items of an item type within an
+        index, in order, starting after the one given.
+        """
+        result = db.session.execute(_item_ids_query(after) + " LIMIT :limit",
+                                    {'index': index, 'item_type': item_type, 'after': after, 'limit': limit})
         return [i[0] for i in result.fetchall()]
 
+    @staticmethod
+    def iter_item_ids(index, item_type, after=None, batch_size=1000):
+        """
+        Like get_item_ids, but yield identifiers as they are read from a
+        server-side cursor, batch_size at a time, so listing all of a large
+        item type doesn't hold them all in memory.
+        """
+        connection = db.session.connection().execution_options(stream_results=True)
+        result = connection.execute(db.text(_item_ids_query(after)),
+                                    {'index': index, 'item_type': item_type, 'after': after})
+        try:
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0]
+        finally:
+            result.close()
+
+    def delete(self):
+        _discard_item_ids([self.id])
+        return super(ItemData, self).delete()
+
     @staticmethod
     def delete_data_item(data_id):
+        _discard_item_ids([data_id])
         result = db.session.execute("DELETE FROM geordi.item_data WHERE id = :id RETURNING item", {'id': data_id})
         item = result.fetchone()[0]
         db.session.execute("DELETE FROM geordi.item_link "
@@ -89,3 +266,10 @@ class ItemData(db.Model, DeleteMixin):
                            "WHERE id = :item AND NOT EXISTS (SELECT TRUE FROM geordi.item_data WHERE item = item.id)",
                            {'item': item})
         db.session.flush()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_item_ids(session):
+    # Rolled back data items may have been resolved, and cached, meanwhile.
+    if _item_ids is not None:
+        _item_ids.clear()
@@ -58,10 +58,11 @@ class ItemDataTestCase(GeordiTestCase):
                              {'id': item_data.id, 'item_id': item_data.item_id, 'data': item_data.data})
 
         # Let's add some data
-        item_data.data = '{"data": true}'
+        item_data.data = {'data': True}
         db.session.flush()
+        db.session.expire(item_data)
         self.assertDictEqual(item_data.to_dict(),
-                             {'id': item_data.id, 'item_id': item_data.item_id, 'data': '{"data": true}'})
+                             {'id': item_data.id, 'item_id': item_data.item_id, 'data': {'data': True}})
 
     def test_delete(self):
         self.assertEqual(ItemData.query.count(), 0)
@@ -73,3 +74,61 @@ class ItemDataTestCase(GeordiTestCase):
 
         item_data.delete()
         self.assertEqual(ItemData.query.count(), 0)
+
+    def test_data_to_items(self):
+        ItemData.create_many([(self.item.id, '{}', 'test/artist/1', None), (self.item.id, '{}', 'test/artist/2', None)])
+        self.assertEqual(ItemData.data_to_item('test/artist/1'), self.item.id)
+        self.assertIsNone(ItemData.data_to_item('test/artist/3'))
+        self.assertEqual(ItemData.data_to_items(['test/artist/1', 'test/artist/2', 'test/artist/3']),
+                         {'test/artist/1': self.item.id, 'test/artist/2': self.item.id})
+        self.assertEqual(ItemData.data_to_items([]), {})
+
+    def test_caching_item_ids(self):
+        other_item = Item.create()
+        ItemData.create_many([(self.item.id, '{}', 'test/artist/1', None), (self.item.id, '{}', 'test/artist/2', None)])
+        db.session.commit()
+        move = "UPDATE geordi.item_data SET item = :item WHERE id = 'test/artist/1'"
+
+        with ItemData.caching_item_ids(1):
+            self.assertEqual(ItemData.data_to_item('test/artist/1'), self.item.id)
+            # Changes made behind the model's back go unnoticed...
+            db.session.execute(move, {'item': other_item.id})
+            self.assertEqual(ItemData.data_to_item('test/artist/1'), self.item.id)
+            # ...unless the entry has been pushed out by another,
+            self.assertEqual(ItemData.data_to_item('test/artist/2'), self.item.id)
+            self.assertEqual(ItemData.data_to_item('test/artist/1'), other_item.id)
+            # or the transaction is rolled back,
+            db.session.rollback()
+            self.assertEqual(ItemData.data_to_item('test/artist/1'), self.item.id)
+            # but changes through the model are seen.
+            ItemData.update_many([(other_item.id, '{}', 'test/artist/1', None)])
+            self.assertEqual(ItemData.data_to_item('test/artist/1'), other_item.id)
+
+        db.session.execute(move, {'item': self.item.id})
+        self.assertEqual(ItemData.data_to_item('test/artist/1'), self.item.id)
+
+    def test_listing(self):
+        ItemData.create_many([(self.item.id, '{}', data_id, None)
+                              for data_id in ['test/artist/2', 'test/artist/1', 'test/album/a/b', 'other/work/1']])
+        ItemData.create(self.item.id, '{}', 'test/label/1')
+        self.assertEqual(ItemData.get('test/album/a/b').local_id, 'a/b')
+        self.assertEqual(ItemData.get('test/label/1').item_type, 'label')
+
+        self.assertEqual(ItemData.get_indexes(), ['other', 'test'])
+        self.assertEqual(ItemData.get_item_types_by_index('test'), ['album', 'artist', 'label'])
+        self.assertEqual(ItemData.get_item_types_by_index('missing'), [])
+        self.assertEqual(ItemData.get_item_ids('test', 'artist'), ['1', '2'])
+        self.assertEqual(ItemData.get_item_ids('test', 'album'), ['a/b'])
+
+    def test_get_stale(self):
+        items = dict((data_id, Item.create().id) for data_id in
+                     ['test/artist/1', 'test/artist/2', 'test/album/1', 'test/album/1:work', 'test/artist/3', 'tests/artist/1'])
+        ItemData.create_many([(item_id, '{"a": 1}', data_id, None) for (data_id, item_id) in items.items()])
+        ItemData.create(self.item.id, '{}', 'test/label/1')
+        Item.update_maps({items['test/artist/3']: ('{}', 'current')})
+
+        stale = ItemData.get_stale('test', None, 'current', limit=2)
+        self.assertEqual(stale, [('test/album/1', items['test/album/1'], '{"a": 1}'),
+                                 ('test/artist/1', items['test/artist/1'], '{"a": 1}')])
+        self.assertEqual([row[0] for row in ItemData.get_stale('test', None, 'current', stale[-1][0])], ['test/artist/2'])
+        self.assertEqual([row[0] for row in ItemData.get_stale('test', 'artist', 'current')], ['test/artist/1', 'test/artist/2'])
@@ -3,10 +3,17 @@ geordi.data.model.item_link
 ---------------------------
 """
 from . import db
+from .cache import LRUCache
+from .item import Item
 from .mixins import DeleteMixin
 from geordi.data.mapping.extract import extract_value
+from sqlalchemy.orm.attributes import set_committed_value
 import re
 
+#: Link types already split into paths into maps, as they recur on every link.
+#: The most recently used are kept, so unusual types don't pile up.
+_type_paths = LRUCache(256)
+
 
 class ItemLink(db.Model, DeleteMixin):
     """Model for the 'item_link' table, storing automatically-extracted links between items."""
@@ -22,8 +29,7 @@ class ItemLink(db.Model, DeleteMixin):
 
     @property
     def value(self):
-        path = [(int(x) if re.match('^\d+$', x) else x) for x in self.type.split('%')]
-        return extract_value(self.item.map_dict, path)[0][1]
+        return extract_value(self.item.map_dict, _type_path(self.type))[0][1]
 
     def to_dict(self):
         return {'type': self.type, 'item_id': self.item_id, 'linked_id': self.linked_id}
@@ -36,6 +42,22 @@ class ItemLink(db.Model, DeleteMixin):
     def get_by_item_id(cls, item_id, **kwargs):
         return cls.query.filter_by(item_id=item_id, **kwargs).all()
 
+    @classmethod
+    def get_by_linked_id(cls, linked_id, **kwargs):
+        """
+        Get the links to an item, along with the maps (and only the maps) of
+        the items they're from, fetched in one more query so each map is read
+        and parsed once however many of the links come from its item.
+        """
+        links = cls.query.filter_by(linked_id=linked_id, **kwargs).order_by(cls.item_id, cls.type).all()
+        if links:
+            items = (Item.query.filter(Item.id.in_(set(link.item_id for link in links)))
+                     .options(*Item.load_options('map_only')))
+            items = dict((item.id, item) for item in items)
+            for link in links:
+                set_committed_value(link, 'item', items[link.item_id])
+        return links
+
     @classmethod
     def find_or_insert(cls, node_item_id, target_item_id, link_type):
         link = cls.get(type=link_type, item_id=node_item_id, linked_id=target_item_id)
@@ -49,3 +71,60 @@ class ItemLink(db.Model, DeleteMixin):
     def delete_by_item_id(cls, item_id, **kwargs):
         cls.query.filter_by(item_id=item_id, **kwargs).delete()
         db.session.flush()
+
+    @classmethod
+    def replace_links(cls, item_id, links):
+        """Make (target item ID, link type) tuples the only links from an item, leaving unchanged ones alone."""
+        return cls.replace_many([item_id], [(item_id, linked_id, link_type) for (linked_id, link_type) in links])
+
+    @classmethod
+    def replace_many(cls, item_ids, links):
+        """
+        Make the links given as (node item ID, target item ID, link type)
+        tuples the only links from the given items, deleting the others with
+        one statement and adding the missing ones with another. Links that
+        are unchanged aren't touched. Links from items other than those given
+        are only added, so links from a derived node that mapping an item
+        gives are only deleted when that node is mapped itself. Returns the
+        numbers of links added and deleted.
+        """
+        item_ids = set(item_ids)
+        links = set(links)
+        sources = item_ids.union(item_id for (item_id, linked_id, link_type) in links)
+        existing = set()
+        if sources:
+            result = db.session.execute("SELECT item, linked, type FROM geordi.item_link WHERE item = ANY(:items)",
+                                        {'items': list(sources)})
+            existing = set(tuple(row) for row in result)
+        stale = [link for link in existing if link[0] in item_ids and link not in links]
+        # Delete first, so a link that only seems to have changed is put back.
+        if stale:
+            (stale_items, stale_linked, stale_types) = zip(*stale)
+            db.session.execute("DELETE FROM geordi.item_link "
+                               "USING unnest(CAST(:types AS text[]), CAST(:items AS integer[]), CAST(:linked AS integer[])) "
+                               "      AS v (type, item, linked) "
+                               "WHERE item_link.type = v.type AND item_link.item = v.item AND item_link.linked = v.linked",
+                               {'types': list(stale_types), 'items': list(stale_items), 'linked': list(stale_linked)})
+        missing = links.difference(existing)
+        cls.insert_many(missing)
+        return (len(missing), len(stale))
+
+    @staticmethod
+    def insert_many(links):
+        """Insert (node item ID, target item ID, link type) tuples with a single statement, skipping any that exist already."""
+        if not links:
+            return
+        (item_ids, linked_ids, types) = zip(*links)
+        db.session.execute("INSERT INTO geordi.item_link (type, item, linked) "
+                           "SELECT * FROM unnest(CAST(:types AS text[]), CAST(:items AS integer[]), CAST(:linked AS integer[])) "
+                           "ON CONFLICT DO NOTHING",
+                           {'types': list(types), 'items': list(item_ids), 'linked': list(linked_ids)})
+
+
+def _type_path(link_type):
+    """Split a link type into the path it is into the map of the item the link is from."""
+    path = _type_paths.get_many([link_type]).get(link_type)
+    if path is None:
+        path = [(int(x) if re.match('^\d+$', x) else x) for x in link_type.split('%')]
+        _type_paths.update({link_type: path})
+    return path
@@ -1,5 +1,5 @@
 from geordi.test_case import GeordiTestCase
-from geordi.data.model.item_link import ItemLink
+from geordi.data.model.item_link import ItemLink, _type_path, _type_paths
 from geordi.data.model.item import Item
 from . import db
 
@@ -73,3 +73,58 @@ class ItemLinkTestCase(GeordiTestCase):
 
         missing_results = ItemLink.get_by_item_id(self.item_2.id)
         self.assertListEqual(missing_results, [])
+
+    def test_get_by_linked_id(self):
+        self.item_1.map = {'release': {'artists': [{'name': 'A'}, {'name': 'B'}]}}
+        ItemLink.insert_many([(self.item_1.id, self.item_2.id, 'release%artists%1'),
+                              (self.item_1.id, self.item_2.id, 'release%artists%0')])
+        db.session.commit()
+        item_2_id = self.item_2.id
+
+        with self.recorded_statements() as statements:
+            links = ItemLink.get_by_linked_id(item_2_id)
+            values = [link.value for link in links]
+        self.assertEqual(values, [{'name': 'A'}, {'name': 'B'}])
+        # The links, then the map they're both from, once.
+        self.assertEqual(len(statements), 2)
+        self.assertListEqual(ItemLink.get_by_linked_id(self.item_1.id), [])
+
+    def test_replace_links(self):
+        linked_item = Item.create()
+        ItemLink.insert_many([(self.item_1.id, self.item_2.id, 'kept'), (self.item_1.id, linked_item.id, 'stale'),
+                              (self.item_2.id, linked_item.id, 'other')])
+        db.session.commit()
+        versions = dict(((link[0], link[1], link[2]), link[3]) for link in
+                        db.session.execute("SELECT item, linked, type, xmin FROM geordi.item_link"))
+
+        counts = ItemLink.replace_links(self.item_1.id, [(self.item_2.id, 'kept'), (linked_item.id, 'new')])
+        db.session.commit()
+        self.assertEqual(counts, (1, 1))
+        links = dict(((link[0], link[1], link[2]), link[3]) for link in
+                     db.session.execute("SELECT item, linked, type, xmin FROM geordi.item_link"))
+        self.assertEqual(sorted(links), sorted([(self.item_1.id, self.item_2.id, 'kept'),
+                                                (self.item_1.id, linked_item.id, 'new'),
+                                                (self.item_2.id, linked_item.id, 'other')]))
+        # Unchanged links weren't rewritten.
+        self.assertEqual(links[(self.item_1.id, self.item_2.id, 'kept')], versions[(self.item_1.id, self.item_2.id, 'kept')])
+
+        self.assertEqual(ItemLink.replace_links(self.item_1.id, [(self.item_2.id, 'kept'), (linked_item.id, 'new')]), (0, 0))
+        self.assertEqual(ItemLink.replace_links(self.item_1.id, []), (0, 2))
+        self.assertEqual(ItemLink.query.count(), 1)
+
+    def test_replace_many_node_links(self):
+        node = Item.create()
+        links = [(self.item_1.id, self.item_2.id, 'recording%works%0'), (node.id, self.item_2.id, 'work%composers%0')]
+        self.assertEqual(ItemLink.replace_many([self.item_1.id], links), (2, 0))
+        # Links from a derived node are only added by the item it's from...
+        self.assertEqual(ItemLink.replace_many([self.item_1.id], links[:1]), (0, 0))
+        self.assertEqual(ItemLink.query.count(), 2)
+        # ...and replaced when the node is mapped itself, as derived nodes map to no links.
+        self.assertEqual(ItemLink.replace_many([node.id], []), (0, 1))
+        self.assertEqual(ItemLink.query.count(), 1)
+
+    def test_type_path(self):
+        self.assertEqual(_type_path('release%artists%10'), ['release', 'artists', 10])
+        for n in range(_type_paths.size + 1):
+            _type_path('release%%artists%%%d' % n)
+        self.assertEqual(len(_type_paths.entries), _type_paths.size)
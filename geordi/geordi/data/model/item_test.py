@@ -1,7 +1,11 @@
 from geordi.test_case import GeordiTestCase
 from geordi.data.model.item import Item
 from geordi.data.model.editor import Editor
+from geordi.data.model.item_data import ItemData
+from geordi.data.model.item_link import ItemLink
+from geordi.data.model.item_redirect import ItemRedirect
 from . import db
+import json
 
 
 class ItemTestCase(GeordiTestCase):
@@ -44,3 +48,60 @@ class ItemTestCase(GeordiTestCase):
         self.assertIn(item_1, items)
         self.assertIn(item_2, items)
         self.assertNotEqual(item_1, item_2)
+
+    def test_map(self):
+        item = Item.create('artist', {'artist': {'name': ['Tester']}})
+        db.session.commit()
+        db.session.expire_all()
+        self.assertEqual(Item.get(item.id).map, {'artist': {'name': ['Tester']}})
+        self.assertEqual(Item.create('artist').map_dict, {})
+
+    def test_get_json(self):
+        item = Item.create('artist', {'artist': {'name': ['Tester']}})
+        other_item = Item.create()
+        ItemData.create(item.id, '{"name": "Tester", "tags": [1, 2.5, null]}', 'test/artist/1')
+        ItemLink.insert_many([(item.id, other_item.id, 'artist%aliases')])
+        db.session.commit()
+        self.assertEqual(json.loads(Item.get_json(item.id)), Item.get(item.id).to_dict())
+        self.assertEqual(json.loads(Item.get_json(other_item.id)), Item.get(other_item.id).to_dict())
+        self.assertIsNone(Item.get_json(other_item.id + 1))
+
+    def test_get_json_many(self):
+        item = Item.create('artist', {'artist': {'name': ['Tester']}})
+        ItemData.create(item.id, '{"name": "Tester"}', 'test/artist/1')
+        other_item = Item.create()
+        db.session.add(ItemRedirect(old_id=other_item.id + 1, new_id=item.id))
+        db.session.commit()
+        self.assertEqual(json.loads(Item.get_json_many([item.id, other_item.id, other_item.id + 1, other_item.id + 2])),
+                         {'items': {str(item.id): item.to_dict(),
+                                    str(other_item.id): other_item.to_dict(),
+                                    str(other_item.id + 1): item.to_dict(),
+                                    str(other_item.id + 2): None},
+                          'redirects': {str(other_item.id + 1): item.id}})
+        self.assertEqual(json.loads(Item.get_json_many([])), {'items': {}, 'redirects': {}})
+
+    def test_get_json_many_redirect_chain(self):
+        item = Item.create('artist')
+        middle_item = Item.create()
+        db.session.add(ItemRedirect(old_id=middle_item.id + 1, new_id=middle_item.id))
+        db.session.add(ItemRedirect(old_id=middle_item.id, new_id=item.id))
+        db.session.commit()
+        self.assertEqual(json.loads(Item.get_json_many([middle_item.id + 1, middle_item.id])),
+                         {'items': {str(middle_item.id + 1): item.to_dict(),
+                                    str(middle_item.id): item.to_dict()},
+                          'redirects': {str(middle_item.id + 1): item.id,
+                                        str(middle_item.id): item.id}})
+
+    def test_load_options(self):
+        item = Item.create('artist', {'artist': {'name': ['Tester']}})
+        ItemData.create(item.id, '{"name": "Tester"}', 'test/artist/1')
+        db.session.commit()
+        item_id = item.id
+        loaded = {'summary': ['map_version', 'type'],
+                  'map_only': ['map', 'map_version', 'type'],
+                  'full': ['item_data', 'item_links', 'map', 'map_version', 'type']}
+        for (profile, attributes) in loaded.items():
+            db.session.expunge_all()
+            item = Item.get(item_id, load=profile)
+            self.assertEqual(sorted(set(item.__dict__) & set(loaded['full'])), attributes)
+        self.assertEqual(item.to_dict()['data'], {'test/artist/1': {'name': 'Tester'}})
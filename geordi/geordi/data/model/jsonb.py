@@ -0,0 +1,26 @@
+"""
+geordi.data.model.jsonb
+-----------------------
+
+A column type for PostgreSQL's jsonb, which this version of SQLAlchemy lacks.
+"""
+from sqlalchemy.types import UserDefinedType
+import json
+
+
+class JSONB(UserDefinedType):
+    """A jsonb column, holding parsed JSON values rather than JSON text."""
+
+    def get_col_spec(self):
+        return 'JSONB'
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return json.dumps(value, separators=(',', ':')) if value is not None else None
+        return process
+
+    def result_processor(self, dialect, coltype):
+        # psycopg2 parses jsonb results itself, unless told otherwise.
+        def process(value):
+            return json.loads(value) if isinstance(value, basestring) else value
+        return process
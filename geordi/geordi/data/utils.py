@@ -2,13 +2,23 @@ from model import db
 from model.item import Item
 from model.item_data import ItemData
 from model.item_link import ItemLink
-from .mapping import map_item, verify_map
+from .mapping import index_dict, map_item, rules_version, verify_map, is_valid_map, should_verify_map
+from collections import OrderedDict, deque
+import hashlib
+import itertools
 import json
+import multiprocessing
 import re
+import time
+
+#: Number of data items mapped and committed together by add_data_items.
+DEFAULT_CHUNK_SIZE = 500
+#: Number of resolved data IDs remembered while adding or remapping data items.
+ITEM_ID_CACHE_SIZE = 100000
 
 def get_renderable(item_id):
     '''Fetch and return an item's data including a pretty-printed version of the data items.'''
-    item = Item.get(item_id)
+    item = Item.get(item_id, load='full')
     if item is not None:
         item = item.to_dict()
         item['data_formatted'] = dict([(d_id, json.dumps(data, indent=4)) for d_id, data in item.get('data', {}).iteritems()])
@@ -17,14 +27,50 @@ def get_renderable(item_id):
 
 def add_data_item(data_id, data_type, data):
     '''Add or update a data item given an ID, type, and data. Create a new item, for additions.'''
-    item_id = original_item_id = ItemData.data_to_item(data_id)
-    if item_id is None:
-        item_id = _create_item(data_type)
-    _register_data_item(item_id, data_id, data, update=original_item_id)
-    _map_item(item_id)
+    ((item_id,), counts) = _add_data_items([(data_id, data_type, data)])
     db.session.commit()
     return item_id
 
+def add_data_items(data_items, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Add or update many data items given an iterable of (ID, type, data) tuples, or
+       (ID, type, data, result) tuples from map_data_items, committing them in chunks.'''
+    counts = {'new': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 0}
+    data_items = iter(data_items)
+    chunks = iter(lambda: list(itertools.islice(data_items, chunk_size)), [])
+    _commit_chunks(chunks, _add_data_items_counts, counts, _ADD_COUNTS_FORMAT)
+    return counts
+
+def remap_items(index=None, item_type=None, chunk_size=DEFAULT_CHUNK_SIZE, jobs=1):
+    '''Map items again from their stored data where their index's rules have changed, optionally
+       only for one index and item type, with jobs worker processes doing the mapping.'''
+    counts = {'remapped': 0, 'failed': 0, 'derived': 0}
+    # Workers only map; all reading and writing stays in this process.
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        for index in ([index] if index is not None else sorted(index_dict.keys())):
+            chunks = _stale_chunks(index, item_type, chunk_size)
+            if pool is not None:
+                chunks = _map_in_pool(pool, chunks, 2 * jobs)
+            else:
+                chunks = ([data_item + (None,) for data_item in chunk] for chunk in chunks)
+            _commit_chunks(chunks, _remap_data_items, counts, _REMAP_COUNTS_FORMAT)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return counts
+
+def map_data_items(data_items):
+    '''Map (ID, type, data) tuples without the database, into (ID, type, data, result) tuples for add_data_items.'''
+    mapped = []
+    for (data_id, data_type, data) in data_items:
+        try:
+            result = _map_data_item(None, data_id, data)
+        except Exception:
+            result = None
+        mapped.append((data_id, data_type, data, result))
+    return mapped
+
 def delete_data_item(data_id):
     ItemData.delete_data_item(data_id)
     db.session.commit()
@@ -37,11 +83,130 @@ def set_sequences():
     db.session.execute("ALTER SEQUENCE item_id_seq RESTART %s", (restart,))
     db.session.commit()
 
-def _create_item(data_type):
-    item = Item.create(type=data_type)
-    if not item.id:
-        raise Exception('No row created')
-    return item.id
+_ADD_COUNTS_FORMAT = "%(new)d new, %(updated)d updated, %(skipped)d skipped, %(failed)d failed, %(derived)d derived nodes"
+_REMAP_COUNTS_FORMAT = "%(remapped)d remapped, %(failed)d failed, %(derived)d derived nodes"
+
+def _commit_chunks(chunks, process, counts, counts_format, committed=None, failed=None):
+    '''Commit process(chunk) for each chunk, retrying failed chunks one element at a time.'''
+    started = time.time()
+    processed = 0
+    # Links to the same items recur from chunk to chunk, so keep resolving them cheap.
+    with ItemData.caching_item_ids(ITEM_ID_CACHE_SIZE):
+        for chunk in chunks:
+            processed += len(chunk)
+            try:
+                _commit_chunk(process, chunk, counts)
+            except Exception as e:
+                db.session.rollback()
+                if len(chunk) > 1:
+                    print "Chunk starting at %s failed (%s: %s), retrying one at a time." % (chunk[0][0], type(e).__name__, e)
+                    for element in chunk:
+                        try:
+                            _commit_chunk(process, [element], counts)
+                        except Exception as e:
+                            db.session.rollback()
+                            print "Failed on %s: %s: %s" % (element[0], type(e).__name__, e)
+                            counts['failed'] += 1
+                            if failed is not None:
+                                failed(element)
+                else:
+                    print "Failed on %s: %s: %s" % (chunk[0][0], type(e).__name__, e)
+                    counts['failed'] += 1
+                    if failed is not None:
+                        failed(chunk[0])
+            if committed is not None:
+                committed()
+            print counts_format % counts
+    elapsed = time.time() - started
+    print "Finished %d in %.1fs (%.1f/s): %s" % (processed, elapsed, processed / elapsed if elapsed else 0, counts_format % counts)
+
+def _commit_chunk(process, chunk, counts):
+    chunk_counts = process(chunk)
+    db.session.commit()
+    for (key, count) in chunk_counts.iteritems():
+        counts[key] += count
+
+def _add_data_items_counts(data_items):
+    (item_ids, counts) = _add_data_items(data_items)
+    return counts
+
+def _add_data_items(data_items):
+    '''Add or update (ID, type, data[, result]) tuples in the current transaction, with the nodes they derive.'''
+    entries = _unique_data_items(data_items)
+    (item_ids, new, skipped) = _register_data_items([(data_id, data_type, data) for (data_id, data_type, data, result) in entries])
+    queue = _store_maps([_map_data_item(item_ids[data_id], data_id, data) if result is None
+                         else _with_item_id(result, item_ids[data_id])
+                         for (data_id, data_type, data, result) in entries if data_id not in skipped])
+    counts = {'new': len(new), 'updated': len(entries) - len(new) - len(skipped), 'skipped': len(skipped),
+              'derived': _add_nodes(queue, set(item_ids))}
+    return ([item_ids[data_item[0]] for data_item in data_items], counts)
+
+def _stale_chunks(index, item_type, chunk_size):
+    '''Yield chunks of (data ID, item ID, data) tuples to remap for an index.'''
+    version = rules_version(index)
+    after = None
+    while True:
+        chunk = ItemData.get_stale(index, item_type, version, after, chunk_size)
+        if not chunk:
+            break
+        after = chunk[-1][0]
+        yield chunk
+
+def _remap_data_items(data_items):
+    '''Map stored (data ID, item ID, data, result) tuples again in the current transaction.'''
+    queue = _store_maps([result if result is not None else _map_data_item(item_id, data_id, data)
+                         for (data_id, item_id, data, result) in data_items])
+    return {'remapped': len(data_items),
+            'derived': _add_nodes(queue, set(data_id for (data_id, item_id, data, result) in data_items))}
+
+def _add_nodes(queue, seen):
+    '''Add the other nodes produced by mapping, and any they produce in turn, skipping data IDs in seen.'''
+    added = 0
+    while queue:
+        # Nodes are added with no type; any types set by links are already
+        # on their items by now.
+        nodes = [(data_id, '', data) for (data_id, data) in queue.iteritems() if data_id not in seen]
+        seen.update(queue)
+        (item_ids, new, skipped) = _register_data_items(nodes)
+        added += len(nodes)
+        queue = _map_items([(item_ids[data_id], data_id, data) for (data_id, data_type, data) in nodes
+                            if data_id not in skipped])
+    return added
+
+def _unique_data_items(data_items):
+    '''Collapse repeated data IDs into one (ID, type, data, result) tuple, keeping the first type and last data.'''
+    entries = OrderedDict()
+    for data_item in data_items:
+        (data_id, data_type, data) = data_item[:3]
+        if data_id in entries:
+            data_type = entries[data_id][0]
+        entries[data_id] = (data_type, data, data_item[3] if len(data_item) > 3 else None)
+    return [(data_id, data_type, data, result) for (data_id, (data_type, data, result)) in entries.iteritems()]
+
+def _register_data_items(data_items):
+    '''Create or update unique (ID, type, data) tuples, skipping unchanged ones; return item IDs, new and skipped IDs.'''
+    existing = ItemData.data_to_items_with_digests([data_id for (data_id, data_type, data) in data_items])
+    item_ids = dict((data_id, item_id) for (data_id, (item_id, digest, map_version)) in existing.iteritems())
+    new = []
+    changed = []
+    skipped = set()
+    for (data_id, data_type, data) in data_items:
+        digest = _data_digest(data)
+        if data_id not in existing:
+            new.append((data_id, data_type, data, digest))
+        elif existing[data_id][1:] == (digest, rules_version(data_id.split('/', 1)[0])):
+            skipped.add(data_id)
+        else:
+            changed.append((item_ids[data_id], data, data_id, digest))
+    ItemData.update_many(changed)
+    item_ids.update(zip([data_id for (data_id, data_type, data, digest) in new],
+                        Item.create_many([data_type for (data_id, data_type, data, digest) in new])))
+    ItemData.create_many([(item_ids[data_id], data, data_id, digest) for (data_id, data_type, data, digest) in new])
+    return (item_ids, [data_id for (data_id, data_type, data, digest) in new], skipped)
+
+def _data_digest(data):
+    '''Digest a data item's JSON as given, which the stored jsonb doesn't keep.'''
+    return hashlib.sha1(data.encode('utf-8') if isinstance(data, unicode) else data).hexdigest()
 
 link_type_map = {
     'release%artists': 'artist',
@@ -64,48 +229,84 @@ def _link_type_to_item_type(link_type):
             return prospect
     return None
 
-def _map_item(item_id):
-    # fetch data
-    item = Item.get(item_id)
+def _map_items(data_items):
+    '''Map (item ID, data ID, data) tuples and store their maps and links, returning the other mapped nodes.'''
+    return _store_maps([_map_data_item(item_id, data_id, data) for (item_id, data_id, data) in data_items])
+
+def _map_data_item(item_id, data_id, data):
+    '''Map one data item without touching the database, returning what _store_maps takes.'''
     # generate map
-    (mapped, links) = map_item(item.to_dict())
-    this_mapped = mapped[None]
-    if list(verify_map(this_mapped)):
+    (mapped, item_links) = map_item({'data': {data_id: json.loads(data)}})
+    this_mapped = mapped.pop(None)
+    if should_verify_map() and not is_valid_map(this_mapped):
         print "Validation errors in mapping item %s: %r, continuing." % (item_id, list(verify_map(this_mapped)))
-    # First, update this item's map
-    item.map = json.dumps(this_mapped, separators=(',', ':'))
-    db.session.flush()
+    links = [(item_id, node, target, '%'.join([str(d) for d in destination])) for (node, destination, target) in item_links]
+    other_nodes = OrderedDict()
+    for (node_id, node_mapped) in mapped.iteritems():
+        if should_verify_map() and not is_valid_map(node_mapped):
+            print "Validation errors in mapping data item %s: %r, continuing" % (node_id, list(verify_map(node_mapped)))
+        other_nodes[node_id] = json.dumps(node_mapped)
+    return (item_id, json.dumps(this_mapped, separators=(',', ':')), rules_version(data_id.split('/', 1)[0]), links, other_nodes)
+
+def _with_item_id(result, item_id):
+    '''Fill in the item ID of a _map_data_item result made without one.'''
+    (unused_item_id, map_json, version, links, other_nodes) = result
+    return (item_id, map_json, version, [(item_id,) + link[1:] for link in links], other_nodes)
+
+def _store_maps(results):
+    '''Store the maps and links of _map_data_item results, returning the other mapped nodes.'''
+    maps = {}
+    links = []
+    other_nodes = OrderedDict()
+    for (item_id, map_json, version, item_links, item_other_nodes) in results:
+        maps[item_id] = (map_json, version)
+        links.extend(item_links)
+        other_nodes.update(item_other_nodes)
+    # First, update the items' maps
+    Item.update_maps(maps)
     # Then, go through the links, creating items as needed with the types designated by their mapping paths
-    ItemLink.delete_by_item_id(item_id)
-    for (node, destination, data_id) in links:
-        link_type = '%'.join([str(d) for d in destination])
-        if node is None:
-            node_item = item_id
-        else:
-            node_item = ItemData.data_to_item(node)
-        target_item = ItemData.data_to_item(data_id)
-        if target_item is None:
-            target_item = _create_item(_link_type_to_item_type(link_type))
-            print "%s -> %s" % (data_id, target_item)
-            _register_data_item(target_item, data_id, '{}')
-        if node_item is None:
-            node_item = _create_item('')
-            print "%s -> %s" % (node, node_item)
-            _register_data_item(node_item, node, '{}')
-        ItemLink.find_or_insert(node_item, target_item, link_type)
-    # Now that we can be assured any types set by links are already set on the items, insert the maps for other mapped nodes
-    for data_id in mapped.keys():
-        if data_id is not None:
-            verify = list(verify_map(mapped[data_id]))
-            if verify:
-                print "Validation errors in mapping data item %s: %r, continuing" % (data_id, verify)
-            add_data_item(data_id, '', json.dumps(mapped[data_id]))
-
-def _register_data_item(item_id, data_id, data, update=False):
-    if not update:
-        ItemData.create(item_id, data, data_id)
-    else:
-        ItemData.update(item_id, data, data_id)
+    link_items = ItemData.data_to_items(set([node for (item_id, node, target, link_type) in links if node is not None] +
+                                            [target for (item_id, node, target, link_type) in links]))
+    placeholders = OrderedDict()
+    for (item_id, node, target, link_type) in links:
+        if target not in link_items and target not in placeholders:
+            placeholders[target] = _link_type_to_item_type(link_type)
+        if node is not None and node not in link_items and node not in placeholders:
+            placeholders[node] = ''
+    for (data_id, item_id) in zip(placeholders.keys(), Item.create_many(placeholders.values())):
+        print "%s -> %s" % (data_id, item_id)
+        link_items[data_id] = item_id
+    ItemData.create_many([(link_items[data_id], '{}', data_id, None) for data_id in placeholders])
+    ItemLink.replace_many(maps.keys(), [(item_id if node is None else link_items[node], link_items[target], link_type)
+                                        for (item_id, node, target, link_type) in links])
+    return other_nodes
+
+def _map_chunk(data_items):
+    '''Map a chunk of stored (data ID, item ID, data) tuples in a worker process.'''
+    return [_map_data_item(item_id, data_id, data) for (data_id, item_id, data) in data_items]
+
+def _map_in_pool(pool, chunks, ahead):
+    '''Map chunks of stored data items in a pool, yielding them in order with their results.'''
+    for (chunk, async_result) in _imap_bounded(pool, _map_chunk, chunks, ahead):
+        yield _pool_chunk(chunk, async_result)
+
+def _imap_bounded(pool, func, args, ahead):
+    '''Call func on each of args in a pool, yielding (arg, async result)
+       tuples in order, with at most ahead calls started but not yet yielded.'''
+    pending = deque()
+    for arg in args:
+        pending.append((arg, pool.apply_async(func, (arg,))))
+        if len(pending) >= ahead:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+def _pool_chunk(chunk, async_result):
+    try:
+        results = async_result.get()
+    except Exception:
+        results = [None] * len(chunk)
+    return [data_item + (result,) for (data_item, result) in zip(chunk, results)]
 
 #def get_entities(mbid_or_mbids, conn=None, cached=True, type_hint=None):
 #    entities = []
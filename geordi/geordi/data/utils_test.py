@@ -0,0 +1,154 @@
+from geordi.test_case import GeordiTestCase, sample_data_items, stored_state
+from geordi.data.model.item import Item
+from geordi.data.model.item_data import ItemData
+from geordi.data.model.item_link import ItemLink
+from geordi.data.utils import add_data_item, add_data_items, map_data_items, remap_items
+from geordi.data import mapping
+from . import db
+import json
+
+
+class AddDataItemsTestCase(GeordiTestCase):
+
+    def setUp(self):
+        super(AddDataItemsTestCase, self).setUp()
+        self.data_items = list(sample_data_items('test_index')) + list(sample_data_items('ci'))
+
+    def test_same_as_add_data_item(self):
+        for (data_id, data_type, data) in self.data_items:
+            add_data_item(data_id, data_type, data)
+        expected = stored_state()
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        counts = add_data_items(self.data_items, chunk_size=2)
+        # Each CI recording maps a ':work' node as well.
+        self.assertEqual(counts, {'new': len(self.data_items), 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 2})
+        self.assertEqual(stored_state(), expected)
+
+    def test_update(self):
+        add_data_items(self.data_items)
+        (items, data, links) = stored_state()
+
+        (data_id, data_type, artist) = self.data_items[1]
+        changed = json.dumps(dict(json.loads(artist), name='Changed'))
+        counts = add_data_items(self.data_items[:1] + [(data_id, data_type, changed)])
+        self.assertEqual(counts, {'new': 0, 'updated': 1, 'skipped': 1, 'failed': 0, 'derived': 0})
+        self.assertEqual(Item.get(ItemData.data_to_item(data_id)).map['artist']['name'], ['Changed'])
+
+        counts = add_data_items(self.data_items)
+        self.assertEqual(counts, {'new': 0, 'updated': 1, 'skipped': len(self.data_items) - 1, 'failed': 0, 'derived': 0})
+        self.assertEqual(stored_state(), (items, data, links))
+
+    def test_update_rules_changed(self):
+        add_data_items(self.data_items)
+        (items, data, links) = stored_state()
+
+        versions = dict(mapping._rules_versions)
+        try:
+            mapping._rules_versions['ci'] = 'changed'
+            counts = add_data_items(self.data_items)
+        finally:
+            mapping._rules_versions.clear()
+            mapping._rules_versions.update(versions)
+        self.assertEqual(counts, {'new': 0, 'updated': 3, 'skipped': 4, 'failed': 0, 'derived': 2})
+        self.assertEqual(stored_state(), (items, data, links))
+
+    def test_failed_chunk(self):
+        bad = ('unknown/artist/1', 'artist', '{}')
+        counts = add_data_items(self.data_items[:2] + [bad] + self.data_items[2:4], chunk_size=3)
+        # test_index/artist/1 already exists by then, as the album links to it.
+        self.assertEqual(counts, {'new': 3, 'updated': 1, 'skipped': 0, 'failed': 1, 'derived': 0})
+        self.assertIsNone(ItemData.data_to_item(bad[0]))
+        for (data_id, data_type, data) in self.data_items[:4]:
+            self.assertEqual(ItemData.get(data_id).data, json.loads(data))
+
+    def test_repeated_data_id(self):
+        (data_id, data_type, data) = self.data_items[1]
+        changed = json.dumps(dict(json.loads(data), name='Changed'))
+        counts = add_data_items([(data_id, data_type, data), (data_id, 'other', changed)])
+        self.assertEqual(counts, {'new': 1, 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 0})
+        item = Item.get(ItemData.data_to_item(data_id))
+        self.assertEqual(item.type, data_type)
+        self.assertEqual(item.item_data[0].data, json.loads(changed))
+
+    def test_derived_nodes(self):
+        recording = [d for d in self.data_items if d[0] == 'ci/recording/1000001'][0]
+        counts = add_data_items([recording, recording])
+        self.assertEqual(counts, {'new': 1, 'updated': 0, 'skipped': 0, 'failed': 0, 'derived': 1})
+
+        work = ItemData.get('ci/recording/1000001:work')
+        self.assertEqual(work.item.map_dict, work.data)
+        links = ItemLink.get_by_item_id(ItemData.data_to_item('ci/recording/1000001'))
+        self.assertIn(work.item_id, [link.linked_id for link in links])
+
+
+    def test_premapped(self):
+        add_data_items(self.data_items)
+        expected = stored_state()
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        bad = ('unknown/artist/1', 'artist', '{}')
+        data_items = map_data_items(self.data_items + [bad])
+        self.assertIsNone(data_items[-1][3])
+        counts = add_data_items(data_items, chunk_size=2)
+        self.assertEqual(counts, {'new': len(self.data_items), 'updated': 0, 'skipped': 0, 'failed': 1, 'derived': 2})
+        self.assertEqual(stored_state(), expected)
+
+
+class RemapItemsTestCase(GeordiTestCase):
+
+    def setUp(self):
+        super(RemapItemsTestCase, self).setUp()
+        add_data_items(list(sample_data_items('test_index')) + list(sample_data_items('ci')))
+        self.versions = dict(mapping._rules_versions)
+
+    def tearDown(self):
+        mapping._rules_versions.clear()
+        mapping._rules_versions.update(self.versions)
+        super(RemapItemsTestCase, self).tearDown()
+
+    def test_nothing_stale(self):
+        self.assertEqual(remap_items(), {'remapped': 0, 'failed': 0, 'derived': 0})
+
+    def test_remap(self):
+        expected = stored_state()
+        item = Item.get(ItemData.data_to_item('test_index/artist/1'))
+        item.map = {}
+        item.map_version = None
+        db.session.commit()
+
+        mapping._rules_versions['ci'] = 'changed'
+        self.assertEqual(remap_items(chunk_size=2), {'remapped': 4, 'failed': 0, 'derived': 2})
+        self.assertEqual(stored_state(), expected)
+        for item in Item.query.all():
+            if item.item_data[0].data != {}:
+                self.assertEqual(item.map_version, mapping.rules_version(item.item_data[0].id.split('/')[0]))
+
+        self.assertEqual(remap_items(), {'remapped': 0, 'failed': 0, 'derived': 0})
+
+    def test_reimport_after_remap(self):
+        data_items = list(sample_data_items('test_index')) + list(sample_data_items('ci'))
+        mapping._rules_versions['ci'] = 'changed'
+        remap_items()
+        counts = add_data_items(data_items)
+        self.assertEqual(counts, {'new': 0, 'updated': 0, 'skipped': len(data_items), 'failed': 0, 'derived': 0})
+
+    def test_remap_item_type(self):
+        mapping._rules_versions['ci'] = 'changed'
+        self.assertEqual(remap_items('ci', 'recording'), {'remapped': 2, 'failed': 0, 'derived': 2})
+        self.assertEqual(remap_items('test_index'), {'remapped': 0, 'failed': 0, 'derived': 0})
+        self.assertEqual(remap_items('ci'), {'remapped': 1, 'failed': 0, 'derived': 0})
+
+    def test_remap_jobs(self):
+        expected = stored_state()
+        mapping._rules_versions['ci'] = 'changed'
+        mapping._rules_versions['test_index'] = 'changed'
+        self.assertEqual(remap_items(chunk_size=1, jobs=2), {'remapped': 7, 'failed': 0, 'derived': 2})
+        self.assertEqual(stored_state(), expected)
+        self.assertEqual(remap_items(jobs=2), {'remapped': 0, 'failed': 0, 'derived': 0})
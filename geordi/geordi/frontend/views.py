@@ -8,7 +8,9 @@ from geordi.data.model.editor import Editor
 from geordi.data.model.entity import Entity
 from geordi.data.model.item import Item
 from geordi.data.model.item_data import ItemData
+from geordi.data.model.item_link import ItemLink
 from geordi.data.model.raw_match import RawMatch
+from geordi.listing import list_limit
 from geordi.user import User
 
 import json
@@ -140,10 +142,10 @@ def item(item_id):
 
 @frontend.route('/item/<int:item_id>/links')
 def item_links(item_id):
-    item = Item.query.filter_by(id=item_id).options(db.joinedload('items_linked').joinedload('item')).first()
+    item = Item.get(item_id, load='summary')
     if item is None:
         abort(404)
-    return render_template('item_links.html', item=item)
+    return render_template('item_links.html', item=item, links=ItemLink.get_by_linked_id(item_id))
 
 @frontend.route('/entity/<mbid>')
 @login_required
@@ -216,10 +218,14 @@ def list_index(index):
 
 @frontend.route('/data/<index>/<item_type>')
 def list_items(index, item_type):
-    item_ids = ItemData.get_item_ids(index, item_type)
-    if not item_ids:
+    after = request.args.get('after')
+    limit = list_limit()
+    item_ids = ItemData.get_item_ids(index, item_type, after, limit + 1)
+    if not item_ids and after is None:
         abort(404)
-    return render_template('itemtype.html', items=item_ids, item_type=item_type, index=index)
+    next_after = item_ids[limit - 1] if len(item_ids) > limit else None
+    return render_template('itemtype.html', items=item_ids[:limit], item_type=item_type, index=index,
+                           next_after=next_after, limit=request.args.get('limit'))
 
 @frontend.route('/data/<index>/<item_type>/<path:data_id>')
 def data_item(index, item_type, data_id):
@@ -1,4 +1,4 @@
-from geordi.test_case import GeordiTestCase
+from geordi.test_case import GeordiTestCase, linked_item
 from geordi.data.model.item import Item
 from geordi.data.model.item_data import ItemData
 
@@ -35,6 +35,25 @@ class FrontendViewsTestCase(GeordiTestCase):
         response = self.client.get("/item/missing/links")
         self.assert404(response)
 
+    def test_item_statements(self):
+        item = linked_item()
+        url = "/item/%s" % item.id
+        with self.recorded_statements() as statements:
+            response = self.client.get(url)
+        self.assertIn('other/artist/1', response.data)
+        # The item, then its data items and its links, each on their own rather than multiplying each other.
+        self.assertEqual(len(statements), 3)
+        self.assertFalse([statement for statement in statements if 'item_data' in statement and 'item_link' in statement])
+
+    def test_item_links_statements(self):
+        item = linked_item()
+        url = "/item/%s/links" % item.id
+        with self.recorded_statements() as statements:
+            response = self.client.get(url)
+        self.assertEqual(response.data.count('recording \xe2\x86\x92 artists'), 3)
+        self.assertEqual(len(statements), 3)
+        self.assertFalse([statement for statement in statements if 'item_data' in statement])
+
     def test_list_indexes(self):
         response = self.client.get("/data")
         self.assert200(response)
@@ -62,6 +81,22 @@ class FrontendViewsTestCase(GeordiTestCase):
         response = self.client.get("/data/%s/missing" % index)
         self.assert404(response)
 
+    def test_list_items_pages(self):
+        item = Item.create()
+        for data_id in ['c', 'a', 'b']:
+            ItemData.create(item_id=item.id, data_json='{}', data_id='test/album/' + data_id)
+
+        response = self.client.get("/data/test/album?limit=2")
+        self.assert200(response)
+        self.assertIn('/data/test/album/a"', response.data)
+        self.assertNotIn('/data/test/album/c"', response.data)
+        self.assertIn('after=b', response.data)
+
+        response = self.client.get("/data/test/album?limit=2&after=b")
+        self.assertIn('/data/test/album/c"', response.data)
+        self.assertNotIn('/data/test/album/a"', response.data)
+        self.assertNotIn('Next page', response.data)
+
     def test_data_item(self):
         item = Item.create()
         index = 'test'
@@ -0,0 +1,7 @@
+from flask import current_app, request
+
+def list_limit():
+    '''Return how many items a page of a listing should have, as the request's limit argument asks, within the
+       configured default and maximum.'''
+    limit = request.args.get('limit', current_app.config['ITEM_LIST_LIMIT'], type=int)
+    return max(1, min(limit, current_app.config['MAX_ITEM_LIST_LIMIT']))
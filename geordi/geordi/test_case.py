@@ -1,6 +1,52 @@
+from contextlib import contextmanager
 from flask.ext.testing import TestCase
 from geordi import create_app
+from sqlalchemy import event
+from geordi.data.model.item import Item
+from geordi.data.model.item_data import ItemData
+from geordi.data.model.item_link import ItemLink
 from . import db
+import os
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test_data')
+
+
+def sample_data_items(index):
+    '''Yield (data ID, type, JSON) tuples for the sample data of an index, from files named by data ID.'''
+    for item_type in sorted(os.listdir(os.path.join(SAMPLE_DATA_DIR, index))):
+        directory = os.path.join(SAMPLE_DATA_DIR, index, item_type)
+        data_type = item_type
+        if os.path.exists(os.path.join(directory, '_itemtype')):
+            with open(os.path.join(directory, '_itemtype')) as f:
+                data_type = f.read().strip()
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith('.json'):
+                with open(os.path.join(directory, file_name)) as f:
+                    yield ('%s/%s/%s' % (index, item_type, file_name[:-5]), data_type, f.read())
+
+
+def linked_item():
+    '''Create an item with two data items, linked to from three items with data and links of their own.'''
+    item = Item.create('artist', {'artist': {'name': ['Tester']}})
+    ItemData.create(item.id, '{"name": "Tester"}', 'test/artist/1')
+    ItemData.create(item.id, '{"name": "Tester"}', 'other/artist/1')
+    links = []
+    for i in range(3):
+        source = Item.create('recording', {'recording': {'artists': [{'name': 'Tester'}]}})
+        ItemData.create(source.id, '{"artist": 1}', 'test/recording/%d' % i)
+        links += [(source.id, item.id, 'recording%artists%0'), (source.id, source.id, 'recording%self')]
+    ItemLink.insert_many(links)
+    db.session.commit()
+    return item
+
+
+def stored_state():
+    '''Describe everything stored, by data ID rather than by item ID.'''
+    data_ids = dict((d.item_id, d.id) for d in ItemData.query.all())
+    items = dict((data_ids[i.id], (i.type, i.map_dict)) for i in Item.query.all())
+    data = dict((d.id, d.data) for d in ItemData.query.all())
+    links = sorted((l.type, data_ids[l.item_id], data_ids[l.linked_id]) for l in ItemLink.query.all())
+    return (items, data, links)
 
 
 class GeordiTestCase(TestCase):
@@ -17,3 +63,15 @@ class GeordiTestCase(TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+
+    @contextmanager
+    def recorded_statements(self):
+        '''Record the SQL statements run within the block, into the list it gives.'''
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
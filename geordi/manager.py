@@ -8,6 +8,7 @@ from geordi.resources import resources_manager
 manager = Manager(create_app)
 manager.add_option('-l', '--log-debug', dest='log_debug', required=False, action='store_true')
 manager.add_option('-s', '--log-sql', dest='log_sql', required=False, action='store_true')
+manager.add_option('-t', '--trace-mapping', dest='trace_mapping', required=False, action='store_true')
 
 manager.add_command('data', data_manager)
 manager.add_command('resources', resources_manager)
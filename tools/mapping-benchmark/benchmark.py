@@ -0,0 +1,114 @@
+#!/usr/bin/python
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+
+GEORDI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'geordi')
+TEST_DATA_DIR = os.path.join(GEORDI_DIR, 'test_data')
+sys.path.insert(0, GEORDI_DIR)
+
+from geordi import create_app
+from geordi.data import add_data_items, remap_items
+from geordi.data.mapping import index_dict, map_data_item
+from geordi.data.mapping.insert import PathInserter
+
+
+def load_data_item(data_id):
+    with open(os.path.join(TEST_DATA_DIR, data_id + '.json')) as f:
+        return json.load(f)
+
+
+def report(name, total, iterations):
+    print '%-40s %10.1f us/call' % (name, total / iterations * 1000000)
+
+
+def bench_map(args):
+    data_ids = args.data_ids or ['ci/recording/1000001', 'ci/recording/1000002']
+    for data_id in data_ids:
+        data = load_data_item(data_id)
+        total = min(timeit.repeat(lambda: map_data_item(data_id, data), number=args.iterations, repeat=3))
+        report(data_id, total, args.iterations)
+
+
+def bench_rules(args):
+    data_ids = args.data_ids or ['ci/recording/1000001', 'ci/recording/1000002']
+    for data_id in data_ids:
+        data = load_data_item(data_id)
+        (index, item_type, _) = data_id.split('/', 2)
+        rules = index_dict[index][item_type]
+        def run_rules():
+            for rule in rules:
+                list(rule.evaluate(data))
+        total = min(timeit.repeat(run_rules, number=args.iterations, repeat=3))
+        report('%s (%d rules)' % (data_id, len(rules)), total, args.iterations)
+
+
+def bench_insert(args):
+    for count in args.counts:
+        def build_release():
+            inserter = PathInserter({})
+            for i in range(count):
+                inserter.insert_data(['release', 'mediums', 'split', 'tracks', (i,), 'name'], 'Track %d' % i)
+        iterations = max(1, args.iterations // count)
+        total = min(timeit.repeat(build_release, number=iterations, repeat=3))
+        report('%d insertions' % count, total, iterations)
+
+
+def bench_remap(args):
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = app.config['TEST_SQLALCHEMY_DATABASE_URI']
+    from geordi.data.model import db
+    recordings = []
+    directory = os.path.join(TEST_DATA_DIR, 'ci', 'recording')
+    for file_name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, file_name)) as f:
+            recordings.append(f.read())
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            add_data_items((('ci/recording/%d' % (9000000 + n), 'recording', recordings[n % len(recordings)])
+                            for n in range(args.items)), args.chunk_size)
+            for jobs in args.jobs:
+                db.session.execute("UPDATE geordi.item SET map_version = NULL")
+                db.session.commit()
+                start = time.time()
+                counts = remap_items('ci', None, args.chunk_size, jobs)
+                elapsed = time.time() - start
+                print '%-40s %10.1f items/s' % ('%d items, %d jobs' % (counts['remapped'], jobs), counts['remapped'] / elapsed)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parts of the mapping process.')
+    subparsers = parser.add_subparsers()
+
+    map_parser = subparsers.add_parser('map', help='time map_data_item per data item')
+    map_parser.add_argument('data_ids', nargs='*', help='data item ids within geordi/test_data')
+    map_parser.add_argument('-n', '--iterations', type=int, default=1000)
+    map_parser.set_defaults(func=bench_map)
+
+    rules_parser = subparsers.add_parser('rules', help='time evaluating the rules for each data item, without insertion')
+    rules_parser.add_argument('data_ids', nargs='*', help='data item ids within geordi/test_data')
+    rules_parser.add_argument('-n', '--iterations', type=int, default=1000)
+    rules_parser.set_defaults(func=bench_rules)
+
+    insert_parser = subparsers.add_parser('insert', help='time building a track list with a number of insertions')
+    insert_parser.add_argument('counts', nargs='*', type=int, default=[10, 100, 1000])
+    insert_parser.add_argument('-n', '--iterations', type=int, default=10000,
+                               help='total number of insertions to time, per count')
+    insert_parser.set_defaults(func=bench_insert)
+
+    remap_parser = subparsers.add_parser('remap', help='time remapping stored items with a number of worker processes')
+    remap_parser.add_argument('jobs', nargs='*', type=int, default=[1, 2, 4])
+    remap_parser.add_argument('-n', '--items', type=int, default=2000, help='number of ci recordings to store and remap')
+    remap_parser.add_argument('-c', '--chunk-size', type=int, default=500)
+    remap_parser.set_defaults(func=bench_remap)
+
+    args = parser.parse_args()
+    args.func(args)